@@ -1,20 +1,38 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
+import hashlib
 import hmac
+import importlib
+import fnmatch
+import functools
+import gc
+import posixpath
+import resource
 import tempfile
+import threading
+import time
+import tracemalloc
 import traceback
 import shutil
+import sys
 import urllib.request
 import urllib.parse
 import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
 
 from lxml import etree
 from pptx import Presentation
+from pptx.oxml import parse_xml
 from pptx.oxml.ns import qn
-from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
 from pptx.opc.packuri import PackURI
+from pptx.parts.slide import NotesSlidePart, SlidePart
+import google_auth_httplib2
+import httplib2
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
@@ -28,21 +46,62 @@ R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
 A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
 
 
+# Package (OPC) namespaces used when rewriting the output ZIP
+CT_NS = 'http://schemas.openxmlformats.org/package/2006/content-types'
+PR_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+@functools.lru_cache(maxsize=None)
 def _pn(tag):
     """Build a namespaced tag for presentationml namespace."""
     return f'{{{P_NS}}}{tag}'
 
 
+@functools.lru_cache(maxsize=None)
 def _p14n(tag):
     """Build a namespaced tag for PowerPoint 2010 namespace."""
     return f'{{{P14_NS}}}{tag}'
 
 
+@functools.lru_cache(maxsize=None)
 def _rn(tag):
     """Build a namespaced tag for relationships namespace."""
     return f'{{{R_NS}}}{tag}'
 
 
+# Precompiled queries for presentation / slide / package traversal. Section
+# parsing, slide-id handling, rId remapping and cleanup all go through these
+# instead of rebuilding tag names and scanning child lists on every call.
+XML_NS = {'p': P_NS, 'p14': P14_NS, 'r': R_NS, 'pr': PR_NS, 'ct': CT_NS}
+R_ID = _rn('id')
+
+xp_sld_id_lst = etree.XPath('./p:sldIdLst', namespaces=XML_NS)
+xp_sld_ids = etree.XPath('./p:sldIdLst/p:sldId', namespaces=XML_NS)
+xp_sld_id_by_id = etree.XPath('./p:sldIdLst/p:sldId[@id=$sid]', namespaces=XML_NS)
+xp_last_sld_id = etree.XPath('./p:sldIdLst/p:sldId[last()]', namespaces=XML_NS)
+xp_section_lsts = etree.XPath('./p:sectionLst | ./p:extLst/p:ext/p14:sectionLst',
+                              namespaces=XML_NS)
+# Section children share the namespace of their sectionLst (p: or p14:)
+xp_sections = etree.XPath('./p:section | ./p14:section', namespaces=XML_NS)
+xp_section_sld_id_lst = etree.XPath('./p:sldIdLst | ./p14:sldIdLst', namespaces=XML_NS)
+xp_section_sld_ids = etree.XPath('./p:sldIdLst/p:sldId/@id | ./p14:sldIdLst/p14:sldId/@id',
+                                 namespaces=XML_NS)
+xp_sld_layout_ids = etree.XPath('./p:sldLayoutIdLst/p:sldLayoutId', namespaces=XML_NS)
+xp_sld_master_ids = etree.XPath('./p:sldMasterIdLst/p:sldMasterId', namespaces=XML_NS)
+xp_embedded_font_refs = etree.XPath('./p:embeddedFontLst/p:embeddedFont/*[@r:id]',
+                                    namespaces=XML_NS)
+xp_r_attributes = etree.XPath('descendant-or-self::*/@r:*', namespaces=XML_NS)
+xp_relationships = etree.XPath('./pr:Relationship', namespaces=XML_NS)
+xp_ct_overrides = etree.XPath('./ct:Override', namespaces=XML_NS)
+xp_ct_defaults = etree.XPath('./ct:Default', namespaces=XML_NS)
+
+
+def find_sld_id(prs_xml, slide_id):
+    """Return the <p:sldId> element for a numeric slide id, or None."""
+    found = xp_sld_id_by_id(prs_xml, sid=str(slide_id))
+    return found[0] if found else None
+
+
 def verify_auth(request):
     """Verify Bearer token using timing-safe comparison."""
     auth_header = request.headers.get('Authorization', '')
@@ -52,13 +111,103 @@ def verify_auth(request):
     return True
 
 
+def verify_cron_auth(request):
+    """Verify the Bearer token Vercel Cron sends (CRON_SECRET).
+
+    Falls back to DISCORD_CRON_SECRET like the Next.js cron routes.
+    """
+    secret = os.environ.get('CRON_SECRET') or os.environ.get('DISCORD_CRON_SECRET')
+    auth_header = request.headers.get('Authorization', '')
+    if not secret or not auth_header:
+        return False
+    return hmac.compare_digest(auth_header, f"Bearer {secret}")
+
+
+# Largest accepted POST body; bigger requests are rejected with 413
+MAX_REQUEST_BYTES = int(os.environ.get('PPTX_MAX_REQUEST_BYTES', 2 * 1024 * 1024))
+
+# Downloaded templates are kept on disk, keyed by Drive md5Checksum, so warm
+# instances (and every worker of a self-hosted server) skip the download.
+TEMPLATE_CACHE_DIR = os.environ.get(
+    'PPTX_TEMPLATE_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'pptx-template-cache'),
+)
+TEMPLATE_CACHE_MAX_FILES = int(os.environ.get('PPTX_TEMPLATE_CACHE_MAX_FILES', 20))
+# How long (seconds) a template's section index is trusted before its Drive
+# checksum is looked up again
+TEMPLATE_INDEX_TTL = float(os.environ.get('PPTX_TEMPLATE_INDEX_TTL', 60))
+
+# Batch inspect: templates fetched/inspected in parallel, and the most ids
+# accepted per request (the template picker lists up to 100 files)
+INSPECT_BATCH_WORKERS = int(os.environ.get('PPTX_INSPECT_BATCH_WORKERS', 8))
+INSPECT_BATCH_MAX_FILES = 100
+
+# Templates fetched and compiled by the warm action (comma-separated Drive ids)
+WARM_TEMPLATE_IDS = [i.strip() for i in os.environ.get('PPTX_WARM_TEMPLATE_IDS', '').split(',')
+                     if i.strip()]
+# Warming more templates than the cache holds would evict the first ones
+WARM_MAX_FILES = TEMPLATE_CACHE_MAX_FILES
+
+# Modules python-pptx / googleapiclient only import on first use
+WARM_MODULES = (
+    'pptx.parts.image',
+    'pptx.parts.media',
+    'pptx.shapes.picture',
+    'pptx.oxml.slide',
+    'googleapiclient.http',
+    'googleapiclient.errors',
+)
+
+# Service endpoints; overridable so the load-test harness can point them at
+# local stand-ins (scripts/loadtest_pptx.py)
+BLOB_API_URL = os.environ.get('BLOB_API_URL', 'https://blob.vercel-storage.com')
+GOOGLE_DRIVE_API_ENDPOINT = os.environ.get('GOOGLE_DRIVE_API_ENDPOINT', '')
+
+_drive_credentials = None
+_drive_credentials_lock = threading.Lock()
+_drive_local = threading.local()
+
+
+def get_drive_credentials():
+    """Return process-wide service-account credentials (built once)."""
+    global _drive_credentials
+    with _drive_credentials_lock:
+        if _drive_credentials is None:
+            creds_json = json.loads(os.environ['GOOGLE_SERVICE_ACCOUNT_JSON'])
+            _drive_credentials = service_account.Credentials.from_service_account_info(
+                creds_json,
+                scopes=['https://www.googleapis.com/auth/drive']
+            )
+        return _drive_credentials
+
+
+def authorize_drive():
+    """Make sure the shared credentials hold a valid access token.
+
+    Called before fanning out to worker threads so they all reuse one token
+    instead of racing to refresh it.
+    """
+    credentials = get_drive_credentials()
+    with _drive_credentials_lock:
+        if not credentials.valid:
+            credentials.refresh(google_auth_httplib2.Request(httplib2.Http()))
+    return credentials
+
+
 def get_drive_service():
-    creds_json = json.loads(os.environ['GOOGLE_SERVICE_ACCOUNT_JSON'])
-    credentials = service_account.Credentials.from_service_account_info(
-        creds_json,
-        scopes=['https://www.googleapis.com/auth/drive']
-    )
-    return build('drive', 'v3', credentials=credentials)
+    """Return a Drive client for the current thread.
+
+    Credentials (and their access token) are shared across threads, but the
+    httplib2 transport behind a googleapiclient service is not thread-safe,
+    so each thread builds its own client once and reuses it.
+    """
+    service = getattr(_drive_local, 'service', None)
+    if service is None:
+        client_options = {'api_endpoint': GOOGLE_DRIVE_API_ENDPOINT} if GOOGLE_DRIVE_API_ENDPOINT else None
+        service = build('drive', 'v3', credentials=get_drive_credentials(),
+                        cache_discovery=False, client_options=client_options)
+        _drive_local.service = service
+    return service
 
 
 def download_file_by_id(service, file_id, dest_path):
@@ -71,6 +220,66 @@ def download_file_by_id(service, file_id, dest_path):
             _, done = downloader.next_chunk()
 
 
+def get_template_checksum(service, file_id):
+    """Return the Drive md5Checksum of a file ('' when Drive does not report one)."""
+    meta = service.files().get(
+        fileId=file_id, fields='md5Checksum', supportsAllDrives=True
+    ).execute()
+    return meta.get('md5Checksum', '')
+
+
+def download_template(service, file_id, dest_path, checksum=None):
+    """Copy a Drive template to dest_path, going through the template cache.
+
+    Looks up the file's md5Checksum (a metadata-only request) unless one is
+    passed in, and only downloads the content when no cached copy with that
+    checksum exists.
+
+    Returns:
+        str: The template's md5Checksum ('' when Drive does not report one)
+    """
+    if checksum is None:
+        checksum = get_template_checksum(service, file_id)
+    if not checksum:
+        download_file_by_id(service, file_id, dest_path)
+        return checksum
+
+    cache_path = os.path.join(TEMPLATE_CACHE_DIR, f'{checksum}.pptx')
+    if not os.path.exists(cache_path):
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        tmp_path = _cache_tmp_path(cache_path)
+        try:
+            download_file_by_id(service, file_id, tmp_path)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _evict_cache_dir(TEMPLATE_CACHE_DIR)
+
+    shutil.copyfile(cache_path, dest_path)
+    return checksum
+
+
+def _cache_tmp_path(cache_path):
+    """Per-writer temp name so concurrent workers never share a partial file."""
+    return f'{cache_path}.{os.getpid()}.{threading.get_ident()}.part'
+
+
+def _evict_cache_dir(cache_dir, suffix='.pptx'):
+    """Keep at most TEMPLATE_CACHE_MAX_FILES entries in a cache dir, dropping the oldest."""
+    try:
+        entries = [os.path.join(cache_dir, n) for n in os.listdir(cache_dir)
+                   if n.endswith(suffix)]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for path in entries[TEMPLATE_CACHE_MAX_FILES:]:
+            os.remove(path)
+            sidecar = path.removesuffix(suffix) + '.json'
+            if os.path.exists(sidecar):
+                os.remove(sidecar)
+    except OSError:
+        pass  # another worker evicted concurrently
+
+
 def overwrite_drive_file(service, file_id, file_path):
     """Overwrite an existing file on Google Drive (update in-place)."""
     media = MediaFileUpload(
@@ -104,31 +313,27 @@ def upload_to_blob(file_path, file_name):
     if not token:
         raise ValueError('BLOB_READ_WRITE_TOKEN environment variable is not set')
 
-    # Read file bytes
-    with open(file_path, 'rb') as f:
-        file_bytes = f.read()
-
     # Construct Blob API URL
     encoded_name = urllib.parse.quote(file_name, safe='')
-    blob_url = f'https://blob.vercel-storage.com/pptx-exports/{encoded_name}'
-
-    # Create request
-    req = urllib.request.Request(
-        blob_url,
-        data=file_bytes,
-        method='PUT',
-        headers={
-            'authorization': f'Bearer {token}',
-            'x-api-version': '7',
-            'x-content-type': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-        }
-    )
+    blob_url = f'{BLOB_API_URL}/pptx-exports/{encoded_name}'
 
-    # Upload
+    # Upload, streaming the body from disk instead of reading it into memory
     try:
-        with urllib.request.urlopen(req) as response:
-            response_data = json.loads(response.read().decode('utf-8'))
-            return response_data.get('url', '')
+        with open(file_path, 'rb') as f:
+            req = urllib.request.Request(
+                blob_url,
+                data=f,
+                method='PUT',
+                headers={
+                    'authorization': f'Bearer {token}',
+                    'x-api-version': '7',
+                    'x-content-type': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                    'content-length': str(os.path.getsize(file_path)),
+                }
+            )
+            with urllib.request.urlopen(req) as response:
+                response_data = json.loads(response.read().decode('utf-8'))
+                return response_data.get('url', '')
     except urllib.error.HTTPError as e:
         error_body = e.read().decode('utf-8') if e.fp else 'No error body'
         raise Exception(f'Blob upload failed with status {e.code}: {error_body}')
@@ -136,124 +341,379 @@ def upload_to_blob(file_path, file_name):
         raise Exception(f'Blob upload failed: {str(e)}')
 
 
-def cleanup_orphaned_parts(pptx_path):
-    """Remove orphaned parts and broken references from PPTX ZIP.
+# Memory budget for one export (MB); exports estimated above it are refused
+# with 413, and above LOW_MEMORY_RATIO of it run in low-memory mode
+MEMORY_BUDGET_MB = float(os.environ.get('PPTX_MEMORY_BUDGET_MB', 1024))
+LOW_MEMORY_RATIO = 0.75
+# Rough in-memory size of a parsed XML part relative to its serialized size
+XML_MEMORY_FACTOR = 8
+# Also record tracemalloc peaks per stage (slower; process-wide, so stage
+# numbers include concurrent requests on a threaded server). Environment
+# only: tracing slows every export in the process while it is on.
+TRACE_MEMORY = os.environ.get('PPTX_TRACE_MEMORY', '') == '1'
+# How often (seconds) RSS is sampled while a stage runs
+MEMORY_SAMPLE_INTERVAL = 0.01
+
+
+class MemoryBudgetExceeded(Exception):
+    """The export is estimated to need more memory than MEMORY_BUDGET_MB."""
+
+
+def current_rss_bytes():
+    """Current resident set size, falling back to the peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process since it started."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mb(n):
+    return round(n / (1024 * 1024), 1)
+
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    """Start tracemalloc for one more tracker, unless something else already traces."""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    """Stop tracemalloc once the last tracker that started it is done."""
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
 
-    python-pptx does not fully clean up deleted slides during serialization.
-    This post-processing step:
-    1. Removes slide XML files not referenced in presentation.xml.rels
-    2. Removes notesSlide XML files not referenced by any remaining slide
-    3. Strips broken notesSlide references from slide .rels files
-    4. Updates [Content_Types].xml to match
+
+class MemoryTracker:
+    """Records RSS (and optionally tracemalloc) figures per export stage.
+
+    A stage's peak_rss_mb is the highest RSS sampled while it ran (every
+    MEMORY_SAMPLE_INTERVAL seconds). RSS is process-wide, so on a threaded
+    server it includes concurrent requests. Call close() when the export is
+    done so tracing stops.
+    """
+
+    def __init__(self, trace=TRACE_MEMORY):
+        self.trace = trace
+        self.stages = []
+        if trace:
+            _acquire_tracemalloc()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        start_rss = current_rss_bytes()
+        peak = [start_rss]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(MEMORY_SAMPLE_INTERVAL):
+                peak[0] = max(peak[0], current_rss_bytes())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        if self.trace:
+            tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            done.set()
+            sampler.join()
+            end_rss = current_rss_bytes()
+            entry = {
+                "stage": name,
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "rss_mb": _mb(end_rss),
+                "rss_delta_mb": _mb(end_rss - start_rss),
+                "peak_rss_mb": _mb(max(peak[0], end_rss)),
+            }
+            if self.trace:
+                entry["traced_peak_mb"] = _mb(tracemalloc.get_traced_memory()[1])
+            self.stages.append(entry)
+
+    def report(self, **extra):
+        return {
+            **extra,
+            # ru_maxrss: the process's high-water mark, not this export's
+            "process_peak_rss_mb": _mb(peak_rss_bytes()),
+            "stages": self.stages,
+        }
+
+    def close(self):
+        if self.trace:
+            self.trace = False
+            _release_tracemalloc()
+
+
+def estimate_export_memory(template_path, compiled, songs):
+    """Estimate the process RSS an export will reach, in bytes.
+
+    Current RSS, plus parsed XML (serialized size x XML_MEMORY_FACTOR), plus
+    binary parts held as blobs, plus the generated slides (base slide XML per
+    planned slide), plus the output written to disk and re-read by cleanup.
     """
-    from lxml import etree as _et
+    xml_bytes = 0
+    blob_bytes = 0
+    with zipfile.ZipFile(template_path) as z:
+        for info in z.infolist():
+            if info.filename.endswith(('.xml', '.rels')):
+                xml_bytes += info.file_size
+            else:
+                blob_bytes += info.file_size
+
+    planned_slides = sum(len(plan_song_slides(song, song.get('section_name', '')))
+                         for song in songs)
+    generated_bytes = planned_slides * compiled.get('base_slide_xml_bytes', 0) * XML_MEMORY_FACTOR
+
+    return (current_rss_bytes() + xml_bytes * XML_MEMORY_FACTOR + blob_bytes
+            + generated_bytes + os.path.getsize(template_path))
+
+
+def check_memory_budget(estimate, budget_mb=MEMORY_BUDGET_MB):
+    """Raise MemoryBudgetExceeded over budget; return True when low-memory mode is needed."""
+    budget = budget_mb * 1024 * 1024
+    if budget <= 0:
+        return False
+    if estimate > budget:
+        raise MemoryBudgetExceeded(
+            f"Export needs an estimated {_mb(estimate)} MB, over the {budget_mb:g} MB memory "
+            f"budget. Use fewer songs or a lighter template (see lint_template)."
+        )
+    return estimate > budget * LOW_MEMORY_RATIO
+
+
+# Parts that are always kept, even if no relationship points at them.
+# Entries are fnmatch patterns against ZIP member names; [Content_Types].xml
+# and _rels/.rels are always kept.
+GC_KEEP_PATTERNS = (
+    'docProps/*',
+)
+
+
+def _rels_name(part_name):
+    """Return the ZIP name of the .rels file belonging to a part ('' = package root)."""
+    if not part_name:
+        return '_rels/.rels'
+    d, _, f = part_name.rpartition('/')
+    return f'{d}/_rels/{f}.rels' if d else f'_rels/{f}.rels'
+
+
+def _resolve_target(source_name, target):
+    """Resolve a relationship Target relative to its source part."""
+    target = urllib.parse.unquote(target)
+    if target.startswith('/'):
+        return target.lstrip('/')
+    base = source_name.rpartition('/')[0]
+    return posixpath.normpath(posixpath.join(base, target))
+
+
+def _rel_kind(rel):
+    """Short relationship type, e.g. 'slide', 'slideLayout', 'notesSlide'."""
+    return rel.get('Type', '').rsplit('/', 1)[-1]
 
+
+def _internal_rels(rels_root, source_name):
+    """Yield (rel element, resolved target) for each internal relationship."""
+    for rel in xp_relationships(rels_root):
+        if rel.get('TargetMode') == 'External':
+            continue
+        yield rel, _resolve_target(source_name, rel.get('Target', ''))
+
+
+def _mark_reachable(names, rels_of, roots):
+    """Mark every part reachable from `roots` over the relationship graph.
+
+    Slide relationships are only followed from the presentation part, so a
+    hyperlink or notes back-reference to a deleted slide cannot resurrect it.
+    """
+    reachable = set()
+    stack = list(roots)
+    while stack:
+        src = stack.pop()
+        rels_root = rels_of(src)
+        if rels_root is None:
+            continue
+        for rel, target in _internal_rels(rels_root, src):
+            if target not in names or target in reachable:
+                continue
+            if _rel_kind(rel) == 'slide' and not src.endswith('presentation.xml'):
+                continue
+            reachable.add(target)
+            stack.append(target)
+    return reachable
+
+
+def _prune_unused_layouts(names, rels_of, xml_of, reachable, prs_name):
+    """Drop slide layouts (and whole masters) that no kept slide uses.
+
+    Edits go through `xml_of`, which returns the cached tree for a ZIP member
+    and marks it for re-serialization. Every kept master retains at least one layout
+    and the presentation retains at least one master.
+    """
+    prs_rels = rels_of(prs_name)
+    masters = [(rel, target) for rel, target in _internal_rels(prs_rels, prs_name)
+               if _rel_kind(rel) == 'slideMaster' and target in names]
+    slides = [target for rel, target in _internal_rels(prs_rels, prs_name)
+              if _rel_kind(rel) == 'slide' and target in reachable]
+
+    used_layouts = set()
+    for slide_name in slides:
+        rels_root = rels_of(slide_name)
+        if rels_root is None:
+            continue
+        for rel, target in _internal_rels(rels_root, slide_name):
+            if _rel_kind(rel) == 'slideLayout':
+                used_layouts.add(target)
+
+    unused_masters = []
+    for master_rel, master_name in masters:
+        master_rels = rels_of(master_name)
+        if master_rels is None:
+            continue
+        layout_rels = [(rel, target) for rel, target in _internal_rels(master_rels, master_name)
+                       if _rel_kind(rel) == 'slideLayout']
+        unused = [(rel, target) for rel, target in layout_rels if target not in used_layouts]
+        if not unused:
+            continue
+        if len(unused) == len(layout_rels):
+            unused_masters.append(master_rel)
+            unused = unused[1:]  # a master must keep at least one layout
+        unused_rids = {rel.get('Id') for rel, _ in unused}
+        master_xml = xml_of(master_name)
+        for layout_id in xp_sld_layout_ids(master_xml):
+            if layout_id.get(R_ID) in unused_rids:
+                layout_id.getparent().remove(layout_id)
+        master_rels = xml_of(_rels_name(master_name))
+        for rel, _ in unused:
+            master_rels.remove(rel)
+
+    if unused_masters and len(unused_masters) < len(masters):
+        unused_rids = {rel.get('Id') for rel in unused_masters}
+        prs_xml = xml_of(prs_name)
+        for master_id in xp_sld_master_ids(prs_xml):
+            if master_id.get(R_ID) in unused_rids:
+                master_id.getparent().remove(master_id)
+        prs_rels = xml_of(_rels_name(prs_name))
+        for rel in unused_masters:
+            prs_rels.remove(rel)
+
+
+def cleanup_orphaned_parts(pptx_path, keep=(), prune_layouts=True):
+    """Garbage-collect the PPTX package so it only contains reachable parts.
+
+    python-pptx does not fully clean up deleted slides during serialization,
+    and templates carry layouts, masters and media that only their example
+    slides used. This post-processing step does a mark-and-sweep over the
+    OPC relationship graph:
+    1. Optionally prunes slide layouts / masters not used by any kept slide
+    2. Marks every part reachable from the package root (_rels/.rels) plus
+       anything matching GC_KEEP_PATTERNS or `keep`
+    3. Removes unreachable parts together with their .rels files
+    4. Strips relationships that point at parts no longer in the package
+    5. Updates [Content_Types].xml to match
+
+    Args:
+        pptx_path: Path to the .pptx file, rewritten in place
+        keep: Extra fnmatch patterns of part names that must be kept
+        prune_layouts: Whether unused layouts and masters are dropped
+    """
+    keep_patterns = tuple(GC_KEEP_PATTERNS) + tuple(keep)
     tmp_path = pptx_path + '.tmp'
-    ct_ns = 'http://schemas.openxmlformats.org/package/2006/content-types'
-    rels_ns = 'http://schemas.openxmlformats.org/package/2006/relationships'
 
     with zipfile.ZipFile(pptx_path, 'r') as zin:
         names = set(zin.namelist())
+        parsed = {}
+        dirty = set()
+
+        def xml_of(name):
+            if name not in parsed:
+                parsed[name] = etree.fromstring(zin.read(name))
+            dirty.add(name)
+            return parsed[name]
+
+        def rels_of(part_name):
+            rels_name = _rels_name(part_name)
+            if rels_name not in names:
+                return None
+            if rels_name not in parsed:
+                parsed[rels_name] = etree.fromstring(zin.read(rels_name))
+            return parsed[rels_name]
+
+        roots = [''] + [n for n in names if not n.endswith('.rels') and
+                        any(fnmatch.fnmatchcase(n, pat) for pat in keep_patterns)]
+        reachable = _mark_reachable(names, rels_of, roots)
+
+        prs_name = None
+        for rel, target in _internal_rels(rels_of(''), ''):
+            if _rel_kind(rel) == 'officeDocument':
+                prs_name = target
+                break
 
-        # Step 1: Find slides referenced by presentation.xml.rels
-        prs_rels_xml = zin.read('ppt/_rels/presentation.xml.rels')
-        prs_rels_root = _et.fromstring(prs_rels_xml)
-        prs_referenced = set()
-        for rel in prs_rels_root.findall(f'{{{rels_ns}}}Relationship'):
-            target = rel.get('Target', '')
-            if target.startswith('/'):
-                prs_referenced.add(target.lstrip('/'))
-            else:
-                prs_referenced.add('ppt/' + target)
-
-        # Step 2: Find orphaned slide files
-        orphaned = set()
-        for name in names:
-            if (name.startswith('ppt/slides/slide') and
-                    name.endswith('.xml') and '/_rels/' not in name
-                    and name not in prs_referenced):
-                orphaned.add(name)
-
-        # Step 3: Collect notesSlide files actually in the ZIP
-        notes_in_zip = set()
-        for name in names:
-            if (name.startswith('ppt/notesSlides/notesSlide') and
-                    name.endswith('.xml') and '/_rels/' not in name):
-                notes_in_zip.add(name)
-
-        # Step 4: Find notesSlides referenced by remaining (non-orphaned) slides
-        notes_referenced = set()
-        for name in names:
-            if (name.startswith('ppt/slides/_rels/slide') and
-                    name.endswith('.xml.rels')):
-                # Skip rels for orphaned slides
-                slide_name = name.replace('/_rels/', '/').removesuffix('.rels')
-                if slide_name in orphaned:
-                    continue
-                rels_xml = zin.read(name)
-                rels_root = _et.fromstring(rels_xml)
-                for rel in rels_root.findall(f'{{{rels_ns}}}Relationship'):
-                    target = rel.get('Target', '')
-                    if 'notesSlide' in target:
-                        resolved = os.path.normpath(
-                            os.path.join('ppt/slides', target)
-                        ).replace('\\', '/')
-                        notes_referenced.add(resolved)
-
-        # Orphaned notesSlides = in ZIP but not referenced by any remaining slide
-        orphaned_notes = notes_in_zip - notes_referenced
-        orphaned |= orphaned_notes
-
-        # Build set of all files to remove (orphaned parts + their .rels)
-        to_remove = set(orphaned)
-        for orph in orphaned:
-            d, f = orph.rsplit('/', 1)
-            to_remove.add(d + '/_rels/' + f + '.rels')
-
-        # Also find notesSlide files referenced but missing from ZIP
-        # (broken references that need stripping from slide .rels)
-        missing_notes = notes_referenced - notes_in_zip
-
-        if not to_remove and not missing_notes:
+        if prune_layouts and prs_name in reachable:
+            _prune_unused_layouts(names, rels_of, xml_of, reachable, prs_name)
+            reachable = _mark_reachable(names, rels_of, roots)
+
+        kept = {n for n in names if n in reachable or n in roots}
+        kept |= {_rels_name(n) for n in kept if _rels_name(n) in names}
+        kept |= {'[Content_Types].xml', _rels_name('')}
+
+        # Strip relationships whose internal target did not survive
+        for name in kept:
+            if not name.endswith('.rels'):
+                continue
+            source = '' if name == '_rels/.rels' else \
+                name.replace('/_rels/', '/').removesuffix('.rels')
+            rels_root = rels_of(source)
+            for rel, target in list(_internal_rels(rels_root, source)):
+                if target not in kept:
+                    xml_of(name).remove(rel)
+
+        removed = names - kept
+        if not removed and not dirty:
             return  # Nothing to clean
 
+        # Drop content-type overrides for removed parts and defaults for
+        # extensions no kept part uses any more
+        ct_root = xml_of('[Content_Types].xml')
+        used_exts = {n.rsplit('.', 1)[-1].lower() for n in kept if '.' in n}
+        for override in xp_ct_overrides(ct_root):
+            if override.get('PartName', '').lstrip('/') not in kept:
+                ct_root.remove(override)
+        for default in xp_ct_defaults(ct_root):
+            ext = default.get('Extension', '').lower()
+            if ext not in used_exts and ext not in ('rels', 'xml'):
+                ct_root.remove(default)
+
         # Rewrite ZIP
         with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zout:
             for item in zin.infolist():
-                if item.filename in to_remove:
+                if item.filename not in kept:
                     continue
-
-                data = zin.read(item.filename)
-
-                # Strip broken notesSlide refs from slide .rels files
-                if (missing_notes and
-                        item.filename.startswith('ppt/slides/_rels/') and
-                        item.filename.endswith('.xml.rels')):
-                    rels_root = _et.fromstring(data)
-                    changed = False
-                    for rel in rels_root.findall(f'{{{rels_ns}}}Relationship'):
-                        target = rel.get('Target', '')
-                        if 'notesSlide' in target:
-                            resolved = os.path.normpath(
-                                os.path.join('ppt/slides', target)
-                            ).replace('\\', '/')
-                            if resolved in missing_notes or resolved in orphaned_notes:
-                                rels_root.remove(rel)
-                                changed = True
-                    if changed:
-                        data = _et.tostring(rels_root, xml_declaration=True,
-                                            encoding='UTF-8', standalone=True)
-
-                # Remove orphaned entries from Content_Types
-                if item.filename == '[Content_Types].xml':
-                    ct_root = _et.fromstring(data)
-                    for override in list(ct_root.findall(f'{{{ct_ns}}}Override')):
-                        pn = override.get('PartName', '').lstrip('/')
-                        if pn in orphaned:
-                            ct_root.remove(override)
-                    data = _et.tostring(ct_root, xml_declaration=True,
-                                        encoding='UTF-8', standalone=True)
-
+                if item.filename in dirty:
+                    data = etree.tostring(parsed[item.filename], xml_declaration=True,
+                                          encoding='UTF-8', standalone=True)
+                else:
+                    data = zin.read(item.filename)
                 zout.writestr(item, data)
 
     os.replace(tmp_path, pptx_path)
@@ -265,38 +725,20 @@ def parse_sections(prs):
     Supports both standard <p:sectionLst> and PowerPoint 2010's
     <p14:sectionLst> inside <p:extLst>.
     """
-    prs_xml = prs._element
-
-    # Try standard namespace first
-    section_lst = prs_xml.find(_pn('sectionLst'))
-    ns_fn = _pn
-
-    # Fall back to p14 namespace in extLst
-    if section_lst is None:
-        ext_lst = prs_xml.find(_pn('extLst'))
-        if ext_lst is not None:
-            for ext in ext_lst.findall(_pn('ext')):
-                section_lst = ext.find(_p14n('sectionLst'))
-                if section_lst is not None:
-                    ns_fn = _p14n
-                    break
-
-    if section_lst is None:
+    # One query finds both; prefer the standard namespace when both exist
+    section_lsts = xp_section_lsts(prs._element)
+    if not section_lsts:
         raise ValueError("Template has no sections. The template must use PowerPoint sections.")
 
+    section_lst = next((el for el in section_lsts if el.tag == _pn('sectionLst')), section_lsts[0])
+    ns_fn = _pn if section_lst.tag == _pn('sectionLst') else _p14n
+
     sections = []
-    for section_el in section_lst.findall(ns_fn('section')):
-        name = section_el.get('name', '')
-        sect_id = section_el.get('id', '')
-        sld_id_lst = section_el.find(ns_fn('sldIdLst'))
-        slide_ids = []
-        if sld_id_lst is not None:
-            for sld_id_el in sld_id_lst.findall(ns_fn('sldId')):
-                slide_ids.append(int(sld_id_el.get('id')))
+    for section_el in xp_sections(section_lst):
         sections.append({
-            'name': name,
-            'id': sect_id,
-            'slide_ids': slide_ids,
+            'name': section_el.get('name', ''),
+            'id': section_el.get('id', ''),
+            'slide_ids': [int(sid) for sid in xp_section_sld_ids(section_el)],
             'element': section_el,
             'ns_fn': ns_fn,
         })
@@ -314,22 +756,16 @@ def find_section_by_name(sections, name):
 
 def get_slide_id_map(prs):
     """Build a mapping of slide_id (int) -> (slide_index, rId, slide object)."""
-    prs_xml = prs._element
-    sld_id_lst = prs_xml.find(_pn('sldIdLst'))
-
-    sld_entries = []
-    for sld_id_el in sld_id_lst.findall(_pn('sldId')):
-        sid = int(sld_id_el.get('id'))
-        rid = sld_id_el.get(_rn('id'))
-        sld_entries.append((sid, rid, sld_id_el))
-
+    # Resolve each slide through its rId directly; prs.slides[idx] re-runs
+    # an XPath over the whole sldIdLst per lookup.
     slide_map = {}
-    for idx, (sid, rid, el) in enumerate(sld_entries):
-        slide_map[sid] = {
+    for idx, el in enumerate(xp_sld_ids(prs._element)):
+        rid = el.get(R_ID)
+        slide_map[int(el.get('id'))] = {
             'index': idx,
             'rId': rid,
             'element': el,
-            'slide': prs.slides[idx] if idx < len(prs.slides) else None,
+            'slide': prs.part.related_slide(rid) if rid in prs.part.rels else None,
         }
 
     return slide_map
@@ -343,22 +779,13 @@ def _remap_slide_rids(element, rId_map):
     """
     if not rId_map or all(k == v for k, v in rId_map.items()):
         return
-    for el in element.iter():
-        for attr_name in list(el.attrib.keys()):
-            if R_NS in attr_name:
-                val = el.get(attr_name)
-                if val in rId_map:
-                    el.set(attr_name, rId_map[val])
+    for value in xp_r_attributes(element):
+        if value in rId_map:
+            value.getparent().set(value.attrname, rId_map[value])
 
 
-def duplicate_slide(prs, slide):
-    """Clone a slide and append it to the presentation.
-
-    Returns: (new_slide, new_slide_id, new_entry_element)
-    """
-    # Find highest slide part number to avoid ZIP duplicate name collisions.
-    # add_slide() uses len(prs.slides)+1 which can collide with existing
-    # slide partnames when slides have been deleted from the collection.
+def _max_slide_part_number(prs):
+    """Highest N among /ppt/slides/slideN.xml parts related to the presentation."""
     max_num = 0
     for rel in prs.part.rels.values():
         if rel.is_external:
@@ -370,6 +797,18 @@ def duplicate_slide(prs, slide):
                 max_num = max(max_num, num)
             except ValueError:
                 pass
+    return max_num
+
+
+def duplicate_slide(prs, slide):
+    """Clone a slide and append it to the presentation.
+
+    Returns: (new_slide, new_slide_id, new_entry_element)
+    """
+    # Find highest slide part number to avoid ZIP duplicate name collisions.
+    # add_slide() uses len(prs.slides)+1 which can collide with existing
+    # slide partnames when slides have been deleted from the collection.
+    max_num = _max_slide_part_number(prs)
 
     new_slide = prs.slides.add_slide(slide.slide_layout)
 
@@ -428,11 +867,7 @@ def duplicate_slide(prs, slide):
     # Remap all r:* attribute references in the copied XML
     _remap_slide_rids(new_slide._element, rId_map)
 
-    prs_xml = prs._element
-    sld_id_lst = prs_xml.find(_pn('sldIdLst'))
-
-    sld_id_entries = sld_id_lst.findall(_pn('sldId'))
-    new_entry = sld_id_entries[-1]
+    new_entry = xp_last_sld_id(prs._element)[0]
     new_slide_id = int(new_entry.get('id'))
 
     return new_slide, new_slide_id, new_entry
@@ -440,19 +875,10 @@ def duplicate_slide(prs, slide):
 
 def delete_slide_by_id(prs, slide_id):
     """Remove a slide from the presentation by its numeric slide ID."""
-    prs_xml = prs._element
-    sld_id_lst = prs_xml.find(_pn('sldIdLst'))
-
-    target_el = None
-    target_rId = None
-    for sld_id_el in sld_id_lst.findall(_pn('sldId')):
-        if int(sld_id_el.get('id')) == slide_id:
-            target_el = sld_id_el
-            target_rId = sld_id_el.get(_rn('id'))
-            break
-
+    target_el = find_sld_id(prs._element, slide_id)
     if target_el is None:
         raise ValueError(f"Slide with id={slide_id} not found in presentation")
+    target_rId = target_el.get(R_ID)
 
     prs_part = prs.part
     # Clear the deleted slide's own relationships to prevent ghost parts
@@ -462,30 +888,19 @@ def delete_slide_by_id(prs, slide_id):
 
     prs_part.rels.pop(target_rId)
 
-    sld_id_lst.remove(target_el)
+    target_el.getparent().remove(target_el)
 
 
 def move_slide_id_after(prs, slide_id_to_move, after_slide_id):
     """Move a <p:sldId> entry to be positioned right after another slide ID."""
-    prs_xml = prs._element
-    sld_id_lst = prs_xml.find(_pn('sldIdLst'))
-
-    move_el = None
-    after_el = None
-    for sld_id_el in sld_id_lst.findall(_pn('sldId')):
-        sid = int(sld_id_el.get('id'))
-        if sid == slide_id_to_move:
-            move_el = sld_id_el
-        if sid == after_slide_id:
-            after_el = sld_id_el
+    move_el = find_sld_id(prs._element, slide_id_to_move)
+    after_el = find_sld_id(prs._element, after_slide_id)
 
     if move_el is None or after_el is None:
         raise ValueError(f"Could not find slide IDs for reordering: move={slide_id_to_move}, after={after_slide_id}")
 
-    sld_id_lst.remove(move_el)
-
-    after_index = list(sld_id_lst).index(after_el)
-    sld_id_lst.insert(after_index + 1, move_el)
+    # addnext() moves the element, so no separate remove/index lookup
+    after_el.addnext(move_el)
 
 
 def inject_text_into_shape(shape, text):
@@ -548,6 +963,60 @@ def set_slide_notes(slide, text):
     notes_slide.notes_text_frame.text = text
 
 
+# Speaker-notes strategies for generated slides:
+#   full      - python-pptx builds each notes slide from the notes master
+#   prototype - the first notes slide is built normally, later ones are copies
+#   none      - generated slides get no speaker notes
+NOTES_MODES = ('full', 'prototype', 'none')
+
+
+def make_notes_writer(prs, mode='prototype'):
+    """Return a `write(slide, text)` function implementing a notes mode.
+
+    The prototype writer avoids python-pptx's per-slide cost of cloning the
+    notes master placeholders and of `next_partname()` walking the whole
+    package: it deep-copies one finished notes slide and numbers new parts
+    from a counter.
+    """
+    if mode not in NOTES_MODES:
+        raise ValueError(f"Unknown notes_mode '{mode}'. Expected one of {list(NOTES_MODES)}")
+    if mode == 'none':
+        return lambda slide, text: None
+    if mode == 'full':
+        return set_slide_notes
+
+    package = prs.part.package
+    state = {'prototype': None, 'master_part': None, 'next_num': 1}
+
+    def write(slide, text):
+        if state['prototype'] is None or slide.has_notes_slide:
+            set_slide_notes(slide, text)
+            if state['prototype'] is None:
+                notes_part = slide.notes_slide.part
+                state['prototype'] = deepcopy(notes_part._element)
+                state['master_part'] = notes_part.part_related_by(RT.NOTES_MASTER)
+                for part in package.iter_parts():
+                    pn = str(part.partname)
+                    if pn.startswith('/ppt/notesSlides/notesSlide') and pn.endswith('.xml'):
+                        try:
+                            state['next_num'] = max(state['next_num'], int(pn[27:-4]) + 1)
+                        except ValueError:
+                            pass
+            return
+
+        partname = PackURI('/ppt/notesSlides/notesSlide%d.xml' % state['next_num'])
+        state['next_num'] += 1
+        notes_part = NotesSlidePart(
+            partname, CT.PML_NOTES_SLIDE, package, deepcopy(state['prototype'])
+        )
+        notes_part.relate_to(state['master_part'], RT.NOTES_MASTER)
+        notes_part.relate_to(slide.part, RT.SLIDE)
+        slide.part.relate_to(notes_part, RT.NOTES_SLIDE)
+        notes_part.notes_slide.notes_text_frame.text = text
+
+    return write
+
+
 def set_morph_transition(slide, duration_ms=1000):
     """Set a morph transition on a slide using mc:AlternateContent.
 
@@ -580,8 +1049,149 @@ def set_morph_transition(slide, duration_ms=1000):
     sld.append(etree.fromstring(transition_xml))
 
 
-def process_song_section(prs, song, section, slide_id_map, shared_base_slide_id):
-    """Process a single song: inject title, clone base slide for lyrics, update section."""
+class FragmentCache:
+    """Size-bounded LRU cache of rendered song slides, shared by all threads.
+
+    A fragment is the list of slides generated for one song: each slide's
+    XML, its relationships and its speaker-notes label.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(fragment):
+        return sum(len(s['xml']) for s in fragment)
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+            return fragment
+
+    def put(self, key, fragment):
+        size = self._sizeof(fragment)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._sizeof(self._entries.pop(key))
+            self._entries[key] = fragment
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._sizeof(evicted)
+
+
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get('PPTX_FRAGMENT_CACHE_BYTES', 32 * 1024 * 1024))
+fragment_cache = FragmentCache(FRAGMENT_CACHE_MAX_BYTES)
+
+
+def song_fragment_key(template_key, shared_base_slide_id, planned):
+    """Cache key for a song's generated slides.
+
+    The slides depend only on the template, the base slide they are cloned
+    from and the slide plan, so the plan is hashed instead of the raw song
+    payload (title and unused lyrics pages don't matter).
+    """
+    canonical = json.dumps(planned, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    song_hash = hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    return (COMPILED_TEMPLATE_VERSION, template_key, shared_base_slide_id, song_hash)
+
+
+def capture_slide_fragment(slide, notes):
+    """Snapshot a generated slide for the fragment cache."""
+    rels = []
+    for rId, rel in slide.part.rels.items():
+        if rel.reltype == RT.NOTES_SLIDE:
+            continue
+        target = rel.target_ref if rel.is_external else str(rel.target_part.partname)
+        rels.append((rId, rel.reltype, target, rel.is_external))
+    return {'xml': etree.tostring(slide._element), 'rels': rels, 'notes': notes}
+
+
+def splice_slide_fragment(prs, cached, targets, partname):
+    """Add a cached slide to the presentation without cloning the base slide.
+
+    `targets` maps partname -> part for everything the base slide relates
+    to. Returns: (new_slide, new_slide_id), or raises KeyError when a cached
+    relationship target is not in `targets`.
+    """
+    slide_part = SlidePart(partname, CT.PML_SLIDE, prs.part.package, parse_xml(cached['xml']))
+    rId_map = {}
+    for rId, reltype, target, is_external in cached['rels']:
+        if is_external:
+            rId_map[rId] = slide_part.rels.get_or_add_ext_rel(reltype, target)
+        else:
+            rId_map[rId] = slide_part.rels.get_or_add(reltype, targets[target])
+    _remap_slide_rids(slide_part._element, rId_map)
+
+    rId = prs.part.relate_to(slide_part, RT.SLIDE)
+    new_entry = xp_sld_id_lst(prs._element)[0].add_sldId(rId)
+    return slide_part.slide, int(new_entry.get('id'))
+
+
+def plan_song_slides(song, section_name):
+    """Work out the slides generated for a song, without touching a deck.
+
+    Returns one dict per generated slide, in order: its kind ('lyrics' or
+    'blank'), the lyric text for the first textbox, the speaker-notes label
+    (None for none) and whether the slide gets a morph transition. Song
+    sections with no mapped lyrics give a blank morph slide, and every song
+    ends with a blank morph slide.
+    """
+    section_order = song.get('section_order', [])
+    lyrics = song.get('lyrics', [])
+    section_lyrics_map = song.get('section_lyrics_map', {})
+
+    planned = []
+    for sect_idx, sect_name in enumerate(section_order):
+        sect_idx_str = str(sect_idx)
+
+        if sect_name.strip().lower() == 'intro':
+            continue
+
+        mapped_lyrics_indices = section_lyrics_map.get(sect_idx_str,
+                                section_lyrics_map.get(sect_idx, []))
+
+        # Per-occurrence page count for note labeling
+        occur_page_count = max(len(mapped_lyrics_indices), 1)
+
+        if not mapped_lyrics_indices:
+            # Single page = plain section name
+            planned.append({'kind': 'blank', 'text': '', 'notes': sect_name, 'morph': True})
+            continue
+
+        for page_num, lyrics_idx in enumerate(mapped_lyrics_indices, 1):
+            if lyrics_idx >= len(lyrics):
+                raise ValueError(
+                    f"Section '{section_name}', sectionOrder[{sect_idx}]='{sect_name}': "
+                    f"lyrics index {lyrics_idx} out of range (have {len(lyrics)} lyrics pages)"
+                )
+            notes = sect_name if occur_page_count == 1 else f"{sect_name}-{page_num}"
+            planned.append({'kind': 'lyrics', 'text': lyrics[lyrics_idx], 'notes': notes,
+                            'morph': False})
+
+    # Blank slide at the end of the song with morph transition
+    planned.append({'kind': 'blank', 'text': '', 'notes': None, 'morph': True})
+    return planned
+
+
+def process_song_section(prs, song, section, slide_id_map, shared_base_slide_id,
+                         set_notes=set_slide_notes, template_key=None, fill_cache=True):
+    """Process a single song: inject title, clone base slide for lyrics, update section.
+
+    `set_notes(slide, text)` writes the section label onto each generated
+    slide; see make_notes_writer(). When `template_key` (the template
+    checksum) is given, the generated slides are looked up in the fragment
+    cache, and stored to it unless `fill_cache` is False.
+
+    Returns: (slides_generated, served_from_fragment_cache)
+    """
     slide_ids = section['slide_ids']
 
     if len(slide_ids) < 2:
@@ -604,74 +1214,64 @@ def process_song_section(prs, song, section, slide_id_map, shared_base_slide_id)
     for sid in slides_to_delete:
         delete_slide_by_id(prs, sid)
 
-    section_order = song.get('section_order', [])
-    lyrics = song.get('lyrics', [])
-    section_lyrics_map = song.get('section_lyrics_map', {})
-
     generated_slide_ids = []
     last_slide_id = section_base_slide_id
 
-    for sect_idx, sect_name in enumerate(section_order):
-        sect_idx_str = str(sect_idx)
-
-        if sect_name.strip().lower() == 'intro':
-            continue
-
-        mapped_lyrics_indices = section_lyrics_map.get(sect_idx_str,
-                                section_lyrics_map.get(sect_idx, []))
-
-        # Per-occurrence page count for note labeling
-        occur_page_count = max(len(mapped_lyrics_indices), 1)
-
-        if not mapped_lyrics_indices:
+    plan = plan_song_slides(song, section['name'])
+    cache_key = None
+    cached = None
+    if template_key:
+        cache_key = song_fragment_key(template_key, shared_base_slide_id, plan)
+        cached = fragment_cache.get(cache_key)
+
+    if cached is not None:
+        targets = {str(rel.target_part.partname): rel.target_part
+                   for rel in base_slide.part.rels.values() if not rel.is_external}
+        next_num = _max_slide_part_number(prs) + 1
+        try:
+            for cached_slide in cached:
+                partname = PackURI('/ppt/slides/slide%d.xml' % next_num)
+                next_num += 1
+                new_slide, new_sid = splice_slide_fragment(prs, cached_slide, targets, partname)
+                move_slide_id_after(prs, new_sid, last_slide_id)
+                generated_slide_ids.append(new_sid)
+                last_slide_id = new_sid
+                if cached_slide['notes'] is not None:
+                    set_notes(new_slide, cached_slide['notes'])
+        except KeyError:
+            # Base slide no longer relates to a cached target: regenerate
+            for sid in generated_slide_ids:
+                delete_slide_by_id(prs, sid)
+            generated_slide_ids = []
+            last_slide_id = section_base_slide_id
+            cached = None
+
+    if cached is None:
+        store = cache_key is not None and fill_cache
+        fragment = []
+        for planned in plan:
             new_slide, new_sid, new_el = duplicate_slide(prs, base_slide)
             textbox = get_first_textbox(new_slide)
             if textbox:
-                inject_text_into_shape(textbox, '')
-            set_morph_transition(new_slide)
+                inject_text_into_shape(textbox, planned['text'])
+            if planned['morph']:
+                set_morph_transition(new_slide)
             move_slide_id_after(prs, new_sid, last_slide_id)
             generated_slide_ids.append(new_sid)
             last_slide_id = new_sid
-            # Add section note (single page = plain name)
-            set_slide_notes(new_slide, sect_name)
-        else:
-            for page_num, lyrics_idx in enumerate(mapped_lyrics_indices, 1):
-                if lyrics_idx >= len(lyrics):
-                    raise ValueError(
-                        f"Section '{section['name']}', sectionOrder[{sect_idx}]='{sect_name}': "
-                        f"lyrics index {lyrics_idx} out of range (have {len(lyrics)} lyrics pages)"
-                    )
-
-                lyrics_text = lyrics[lyrics_idx]
-
-                new_slide, new_sid, new_el = duplicate_slide(prs, base_slide)
-                textbox = get_first_textbox(new_slide)
-                if textbox:
-                    inject_text_into_shape(textbox, lyrics_text)
-                move_slide_id_after(prs, new_sid, last_slide_id)
-                generated_slide_ids.append(new_sid)
-                last_slide_id = new_sid
-                # Add section note
-                if occur_page_count == 1:
-                    set_slide_notes(new_slide, sect_name)
-                else:
-                    set_slide_notes(new_slide, f"{sect_name}-{page_num}")
-
-    # Append a blank slide at the end of the song with morph transition
-    blank_slide, blank_sid, blank_el = duplicate_slide(prs, base_slide)
-    textbox = get_first_textbox(blank_slide)
-    if textbox:
-        inject_text_into_shape(textbox, '')
-    set_morph_transition(blank_slide)
-    move_slide_id_after(prs, blank_sid, last_slide_id)
-    generated_slide_ids.append(blank_sid)
+            if store:
+                fragment.append(capture_slide_fragment(new_slide, planned['notes']))
+            if planned['notes'] is not None:
+                set_notes(new_slide, planned['notes'])
+        if store:
+            fragment_cache.put(cache_key, fragment)
 
     if section_base_slide_id != shared_base_slide_id:
         delete_slide_by_id(prs, section_base_slide_id)
 
     section_el = section['element']
     ns_fn = section.get('ns_fn', _pn)
-    sld_id_lst = section_el.find(ns_fn('sldIdLst'))
+    sld_id_lst = xp_section_sld_id_lst(section_el)[0]
 
     for child in list(sld_id_lst):
         sld_id_lst.remove(child)
@@ -683,37 +1283,53 @@ def process_song_section(prs, song, section, slide_id_map, shared_base_slide_id)
         entry = etree.SubElement(sld_id_lst, ns_fn('sldId'))
         entry.set('id', str(gen_sid))
 
-    return len(generated_slide_ids)
+    return len(generated_slide_ids), cached is not None
 
 
-def process_all_songs(prs, songs):
-    """Process all songs in the presentation."""
-    sections = parse_sections(prs)
-    slide_id_map = get_slide_id_map(prs)
+def find_shared_base_slide_id(sections, slide_id_map):
+    """Pick the slide every generated lyric slide is cloned from.
 
-    # Find shared base slide: try each section's slide_ids[1] until one has text
-    shared_base_slide_id = None
+    Tries each section's slide_ids[1] until one has a non-empty first
+    textbox, falling back to the first section that has a slide_ids[1].
+    """
     for section in sections:
         if len(section['slide_ids']) >= 2:
             candidate_id = section['slide_ids'][1]
             candidate_slide = slide_id_map[candidate_id]['slide']
             textbox = get_first_textbox(candidate_slide)
             if textbox is not None and textbox.text_frame.text.strip():
-                shared_base_slide_id = candidate_id
-                break
+                return candidate_id
 
     # If no section had a text-bearing base, fall back to first section's slide_ids[1]
-    if shared_base_slide_id is None:
-        for section in sections:
-            if len(section['slide_ids']) >= 2:
-                shared_base_slide_id = section['slide_ids'][1]
-                break
+    for section in sections:
+        if len(section['slide_ids']) >= 2:
+            return section['slide_ids'][1]
+
+    raise ValueError("No section has a base slide (slide_ids[1]) to use as shared base")
+
+
+def process_all_songs(prs, songs, notes_mode='prototype', shared_base_slide_id=None,
+                      template_key=None, fill_fragment_cache=True):
+    """Process all songs in the presentation.
+
+    `notes_mode` selects how section-label speaker notes are written
+    (one of NOTES_MODES). `shared_base_slide_id` can be passed in from a
+    compiled template to skip the base-slide search, and `template_key`
+    (its checksum) enables the per-song fragment cache; with
+    `fill_fragment_cache` False cached songs are reused but none are added.
+    """
+    set_notes = make_notes_writer(prs, notes_mode)
+    sections = parse_sections(prs)
+    slide_id_map = get_slide_id_map(prs)
 
     if shared_base_slide_id is None:
-        raise ValueError("No section has a base slide (slide_ids[1]) to use as shared base")
+        shared_base_slide_id = find_shared_base_slide_id(sections, slide_id_map)
+    elif shared_base_slide_id not in slide_id_map:
+        raise ValueError(f"Shared base slide id={shared_base_slide_id} not found in presentation")
 
     total_slides = 0
     songs_processed = 0
+    songs_from_cache = 0
 
     for song in songs:
         section_name = song.get('section_name', '')
@@ -728,8 +1344,11 @@ def process_all_songs(prs, songs):
                 f"Available sections: {available}"
             )
 
-        slides = process_song_section(prs, song, section, slide_id_map, shared_base_slide_id)
+        slides, from_cache = process_song_section(prs, song, section, slide_id_map,
+                                                  shared_base_slide_id, set_notes, template_key,
+                                                  fill_fragment_cache)
         total_slides += slides
+        songs_from_cache += from_cache
         songs_processed += 1
 
         slide_id_map = get_slide_id_map(prs)
@@ -740,6 +1359,7 @@ def process_all_songs(prs, songs):
     return {
         'songs_processed': songs_processed,
         'slides_generated': total_slides,
+        'songs_from_cache': songs_from_cache,
     }
 
 
@@ -786,6 +1406,521 @@ def inspect_template(pptx_path):
     }
 
 
+# lint_template thresholds
+LINT_LARGE_IMAGE_BYTES = 1024 * 1024
+LINT_BASE_SLIDE_MAX_SHAPES = 15
+LINT_BASE_SLIDE_MAX_XML_BYTES = 50 * 1024
+LINT_CLONE_SAMPLES = 20
+
+
+def _png_dimensions(blob):
+    """Return (width, height) from a PNG header, or None for other formats."""
+    if blob[:8] != b'\x89PNG\r\n\x1a\n' or len(blob) < 24:
+        return None
+    return int.from_bytes(blob[16:20], 'big'), int.from_bytes(blob[20:24], 'big')
+
+
+def lint_template(pptx_path):
+    """Report template properties that make exports slow or decks large.
+
+    Looks for large or uncompressed images (worst when every exported deck
+    carries them), example slides that each export loads and then deletes,
+    embedded fonts, a complex shared base slide that is deep-copied for
+    every generated slide, and layouts no slide uses. Uses the same section
+    parsing and shared-base-slide choice as process_all_songs().
+
+    Returns:
+        dict: summary numbers and a list of hazards (kind, severity, message
+        plus the figures behind it)
+    """
+    prs = Presentation(pptx_path)
+    sections = parse_sections(prs)
+    slide_id_map = get_slide_id_map(prs)
+    shared_base_slide_id = find_shared_base_slide_id(sections, slide_id_map)
+
+    with zipfile.ZipFile(pptx_path) as z:
+        zip_sizes = {'/' + i.filename: (i.file_size, i.compress_size) for i in z.infolist()}
+
+    hazards = []
+
+    # Which slides use each part (images, fonts, ...), directly or through
+    # their layout and master, where background images usually live
+    used_by = {}
+    for sid, entry in slide_id_map.items():
+        layout = entry['slide'].slide_layout
+        for source in (entry['slide'].part, layout.part, layout.slide_master.part):
+            for rel in source.rels.values():
+                # A master relates to all of its layouts, not just this one
+                if not rel.is_external and rel.reltype != RT.SLIDE_LAYOUT:
+                    used_by.setdefault(str(rel.target_part.partname), set()).add(sid)
+
+    title_slide_ids = {s['slide_ids'][0] for s in sections if s['slide_ids']}
+    example_slide_ids = {sid for s in sections for sid in s['slide_ids'][2:]}
+    every_deck = title_slide_ids | {shared_base_slide_id}
+
+    # Large images
+    media_bytes = 0
+    for part in prs.part.package.iter_parts():
+        partname = str(part.partname)
+        if not partname.startswith('/ppt/media/'):
+            continue
+        size = len(part.blob)
+        media_bytes += size
+        if size < LINT_LARGE_IMAGE_BYTES:
+            continue
+        slides = used_by.get(partname, set())
+        dims = _png_dimensions(part.blob)
+        if slides & every_deck:
+            shrinks = "every exported deck"
+            note = "used by a title/base slide or its layout/master, so every export carries it"
+        elif slides and slides <= example_slide_ids:
+            shrinks, note = None, "only used by example slides that exports delete"
+        elif slides:
+            shrinks, note = "exports that keep the slides using it", None
+        else:
+            shrinks, note = None, "not used by any slide, so exports drop it"
+        hazard = {
+            "kind": "large_image",
+            "severity": "high" if slides & every_deck else "medium",
+            "part": partname,
+            "bytes": size,
+            "compressed_bytes": zip_sizes.get(partname, (size, size))[1],
+            "slide_ids": sorted(slides),
+            "message": f"{partname} is {size / 1048576:.1f} MB",
+        }
+        if dims:
+            hazard["width"], hazard["height"] = dims
+            hazard["message"] += f" ({dims[0]}x{dims[1]} PNG"
+            if shrinks:
+                hazard["message"] += f"; a JPEG or a smaller PNG would shrink {shrinks}"
+            hazard["message"] += ")"
+        if note:
+            hazard["message"] += f"; {note}"
+        hazards.append(hazard)
+
+    # Example slides loaded and deleted on every export of their section
+    for section in sections:
+        extra = section['slide_ids'][2:]
+        if not extra:
+            continue
+        extra_bytes = 0
+        for sid in extra:
+            slide_part = slide_id_map[sid]['slide'].part
+            extra_bytes += zip_sizes.get(str(slide_part.partname), (0, 0))[0]
+            for rel in slide_part.rels.values():
+                if rel.is_external:
+                    continue
+                target = str(rel.target_part.partname)
+                if target.startswith('/ppt/media/') and used_by.get(target, set()) <= set(extra):
+                    extra_bytes += len(rel.target_part.blob)
+        hazards.append({
+            "kind": "unused_example_slides",
+            "severity": "medium" if len(extra) > 5 else "low",
+            "section": section['name'],
+            "slide_count": len(extra),
+            "bytes": extra_bytes,
+            "message": (f"Section '{section['name']}' has {len(extra)} "
+                        f"slide{'s' if len(extra) != 1 else ''} after the "
+                        f"title and base slide ({extra_bytes / 1024:.0f} KB incl. their "
+                        f"own media); they are parsed and deleted by every export using it"),
+        })
+
+    # Embedded fonts
+    for el in xp_embedded_font_refs(prs._element):
+        font_part = prs.part.related_part(el.get(R_ID))
+        typeface = el.getparent().find(_pn('font'))
+        name = typeface.get('typeface', '') if typeface is not None else ''
+        size = len(font_part.blob)
+        hazards.append({
+            "kind": "embedded_font",
+            "severity": "medium" if size >= LINT_LARGE_IMAGE_BYTES else "low",
+            "font": name,
+            "part": str(font_part.partname),
+            "bytes": size,
+            "message": f"Embedded font '{name}' adds {size / 1024:.0f} KB to every exported deck",
+        })
+
+    # Shared base slide: deep-copied once per generated slide
+    base_slide = slide_id_map[shared_base_slide_id]['slide']
+    base_xml_bytes = len(etree.tostring(base_slide._element))
+    base_shapes = len(base_slide.shapes)
+    clone_start = time.perf_counter()
+    for _ in range(LINT_CLONE_SAMPLES):
+        deepcopy(base_slide._element)
+    clone_ms = (time.perf_counter() - clone_start) * 1000 / LINT_CLONE_SAMPLES
+    if base_shapes > LINT_BASE_SLIDE_MAX_SHAPES or base_xml_bytes > LINT_BASE_SLIDE_MAX_XML_BYTES:
+        hazards.append({
+            "kind": "complex_base_slide",
+            "severity": "medium",
+            "slide_id": shared_base_slide_id,
+            "shape_count": base_shapes,
+            "xml_bytes": base_xml_bytes,
+            "clone_ms_per_slide": round(clone_ms, 3),
+            "message": (f"Base slide {shared_base_slide_id} has {base_shapes} shapes "
+                        f"({base_xml_bytes / 1024:.0f} KB XML), copied for every lyric slide "
+                        f"(~{clone_ms:.2f} ms each)"),
+        })
+
+    # Layouts no slide uses. compile_template() prunes them, so exports never
+    # load them; they only make the template and its one-time compile bigger.
+    used_layouts = {str(e['slide'].slide_layout.part.partname) for e in slide_id_map.values()}
+    unused_layouts = [str(layout.part.partname)
+                      for master in prs.slide_masters for layout in master.slide_layouts
+                      if str(layout.part.partname) not in used_layouts]
+    if unused_layouts:
+        layout_bytes = sum(zip_sizes.get(name, (0, 0))[0] for name in unused_layouts)
+        hazards.append({
+            "kind": "unused_layouts",
+            "severity": "low",
+            "count": len(unused_layouts),
+            "parts": unused_layouts,
+            "bytes": layout_bytes,
+            "message": (f"{len(unused_layouts)} layout{'s are' if len(unused_layouts) != 1 else ' is'} "
+                        f"not used by any slide ({layout_bytes / 1024:.0f} KB of XML); compiling "
+                        f"the template prunes them, so they only add to template size and "
+                        f"compile time, not to exports"),
+        })
+
+    severity_rank = {"high": 0, "medium": 1, "low": 2}
+    hazards.sort(key=lambda h: severity_rank[h['severity']])
+
+    return {
+        "file_size": os.path.getsize(pptx_path),
+        "slide_count": len(slide_id_map),
+        "section_count": len(sections),
+        "media_bytes": media_bytes,
+        "base_slide": {
+            "slide_id": shared_base_slide_id,
+            "shape_count": base_shapes,
+            "xml_bytes": base_xml_bytes,
+            "clone_ms_per_slide": round(clone_ms, 3),
+        },
+        "hazards": hazards,
+    }
+
+
+def inspect_templates(file_ids, max_workers=INSPECT_BATCH_WORKERS):
+    """Fetch and inspect many Drive templates concurrently.
+
+    Each worker thread uses its own Drive client built on the shared,
+    already-authorized credentials. A failure on one template is reported
+    in its result instead of failing the batch.
+
+    Returns:
+        list: One {file_id, success, data | error} dict per id, in input order
+    """
+    authorize_drive()
+
+    def inspect_one(file_id):
+        tmp_dir = tempfile.mkdtemp()
+        template_path = os.path.join(tmp_dir, 'template.pptx')
+        try:
+            download_template(get_drive_service(), file_id, template_path)
+            return {"file_id": file_id, "success": True, "data": inspect_template(template_path)}
+        except Exception as e:
+            return {"file_id": file_id, "success": False, "error": str(e)}
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_ids)))) as pool:
+        return list(pool.map(inspect_one, file_ids))
+
+
+def warm_caches(file_ids):
+    """Prime this instance before exports: modules, Drive client, templates.
+
+    Each template is fetched and compiled through get_compiled_template(),
+    which also fills the raw/compiled template caches and the preview index.
+
+    Returns:
+        dict: The steps performed with their duration in ms (and, for
+        templates, the checksum or the error) plus the total
+    """
+    steps = []
+    started = time.perf_counter()
+
+    def timed(step, fn, **info):
+        step_start = time.perf_counter()
+        entry = {"step": step, **info}
+        try:
+            result = fn()
+            entry["success"] = True
+            if result:
+                entry.update(result)
+        except Exception as e:
+            entry.update(success=False, error=str(e))
+        entry["ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+        steps.append(entry)
+
+    def load_modules():
+        for name in WARM_MODULES:
+            importlib.import_module(name)
+        Presentation()  # loads python-pptx's default package and oxml classes
+
+    def build_drive_client():
+        authorize_drive()
+        get_drive_service()
+
+    def compile_one(file_id):
+        checksum, compiled = get_compiled_template(get_drive_service(), file_id)
+        return {"checksum": checksum, "compiled_size": compiled.get('compiled_size')}
+
+    timed("modules", load_modules)
+    timed("drive_client", build_drive_client)
+    for file_id in file_ids:
+        timed("template", lambda: compile_one(file_id), file_id=file_id)
+
+    return {
+        "steps": steps,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# Bump when the compiled artifact layout or metadata changes
+COMPILED_TEMPLATE_VERSION = 3
+COMPILED_TEMPLATE_DIR = os.path.join(TEMPLATE_CACHE_DIR, 'compiled')
+
+
+def compile_template(template_path, output_path):
+    """Compile an authoring template into a slim generation-ready package.
+
+    Everything here depends only on the template: section parsing, the
+    shared base slide search, and a garbage-collecting save that drops
+    orphaned parts, layouts no slide uses and their media. Per-section
+    slide deletions are left to export time, because sections without a
+    song keep all of their slides in the output.
+
+    Returns:
+        dict: Metadata for the compiled package (sections, shared base slide,
+        slide order and first-textbox text of every slide)
+    """
+    prs = Presentation(template_path)
+    sections = parse_sections(prs)
+    slide_id_map = get_slide_id_map(prs)
+    shared_base_slide_id = find_shared_base_slide_id(sections, slide_id_map)
+
+    slide_order = sorted(slide_id_map, key=lambda sid: slide_id_map[sid]['index'])
+    slide_texts = {}
+    for sid in slide_order:
+        textbox = get_first_textbox(slide_id_map[sid]['slide'])
+        slide_texts[str(sid)] = textbox.text_frame.text if textbox is not None else ''
+
+    prs.save(output_path)
+    cleanup_orphaned_parts(output_path)
+
+    return {
+        "version": COMPILED_TEMPLATE_VERSION,
+        "shared_base_slide_id": shared_base_slide_id,
+        "slide_count": len(slide_id_map),
+        "slide_order": slide_order,
+        "slide_texts": slide_texts,
+        "base_slide_xml_bytes": len(etree.tostring(slide_id_map[shared_base_slide_id]['slide']._element)),
+        "sections": [
+            {"name": s['name'], "id": s['id'], "slide_ids": s['slide_ids']}
+            for s in sections
+        ],
+        "source_size": os.path.getsize(template_path),
+        "compiled_size": os.path.getsize(output_path),
+    }
+
+
+def get_compiled_template(service, file_id, dest_path=None, force=False):
+    """Copy the compiled form of a Drive template to dest_path.
+
+    Compiled packages are cached next to the raw templates, keyed by the
+    template's md5Checksum, and built on first use (or when `force` is set).
+    With no dest_path only the metadata is returned.
+
+    Returns:
+        (str, dict): The template checksum and the compiled metadata
+    """
+    checksum = get_template_checksum(service, file_id)
+    if not checksum:
+        # No checksum to key on: compile into place without caching
+        tmp_dir = tempfile.mkdtemp()
+        raw_path = os.path.join(tmp_dir, 'template.pptx')
+        try:
+            download_file_by_id(service, file_id, raw_path)
+            return checksum, compile_template(
+                raw_path, dest_path or os.path.join(tmp_dir, 'compiled.pptx')
+            )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    cache_path = os.path.join(COMPILED_TEMPLATE_DIR, f'{checksum}.pptx')
+    meta_path = os.path.join(COMPILED_TEMPLATE_DIR, f'{checksum}.json')
+    # Two attempts: another worker may evict the entry between the metadata
+    # check and the copy, in which case it is rebuilt once
+    for attempt in range(2):
+        meta = None if force else _read_compiled_meta(cache_path, meta_path)
+        if meta is None:
+            # Concurrent exports of the same template wait for one compile
+            with _compile_lock(checksum):
+                meta = None if force else _read_compiled_meta(cache_path, meta_path)
+                if meta is None:
+                    meta = _compile_into_cache(service, file_id, checksum, cache_path, meta_path)
+            force = False
+        if not dest_path:
+            break
+        try:
+            shutil.copyfile(cache_path, dest_path)
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+
+    _template_index_cache[file_id] = (time.monotonic(), meta)
+    return checksum, meta
+
+
+_compile_locks = {}
+_compile_locks_lock = threading.Lock()
+
+
+def _compile_lock(checksum):
+    """Return the lock serialising compiles of one template checksum."""
+    with _compile_locks_lock:
+        return _compile_locks.setdefault(checksum, threading.Lock())
+
+
+def _read_compiled_meta(cache_path, meta_path):
+    """Load cached compiled metadata, or None when missing or from an older version."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == COMPILED_TEMPLATE_VERSION else None
+
+
+def _compile_into_cache(service, file_id, checksum, cache_path, meta_path):
+    """Download and compile a template, then publish package and metadata atomically."""
+    os.makedirs(COMPILED_TEMPLATE_DIR, exist_ok=True)
+    raw_path = _cache_tmp_path(cache_path) + '.raw'
+    tmp_path = _cache_tmp_path(cache_path)
+    try:
+        download_template(service, file_id, raw_path, checksum)
+        meta = compile_template(raw_path, tmp_path)
+        meta['checksum'] = checksum
+        with open(_cache_tmp_path(meta_path), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(_cache_tmp_path(meta_path), meta_path)
+        os.replace(tmp_path, cache_path)
+    finally:
+        for path in (raw_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    _evict_cache_dir(COMPILED_TEMPLATE_DIR)
+    return meta
+
+
+_template_index_cache = {}
+
+
+def get_template_index(service, file_id):
+    """Return compiled template metadata, skipping Drive for TEMPLATE_INDEX_TTL seconds.
+
+    Within the TTL a template that changed on Drive is not noticed; the
+    preview is the only caller, and exports always check the checksum.
+    """
+    cached = _template_index_cache.get(file_id)
+    if cached is not None and time.monotonic() - cached[0] < TEMPLATE_INDEX_TTL:
+        return cached[1]
+    _, meta = get_compiled_template(service, file_id)
+    return meta
+
+
+def preview_export(index, songs, notes_mode='prototype'):
+    """Outline the deck an export would produce, slide by slide.
+
+    Replays process_all_songs() over the compiled template index (slide
+    order, sections, first-textbox text) instead of a Presentation, so no
+    slide is cloned and nothing is written.
+
+    Returns:
+        dict: slide_count and one entry per output slide with its template
+        section, kind ('title', 'lyrics', 'blank' or 'template'), text,
+        speaker-notes label and whether a morph transition is applied
+    """
+    if notes_mode not in NOTES_MODES:
+        raise ValueError(f"Unknown notes_mode '{notes_mode}'. Expected one of {list(NOTES_MODES)}")
+
+    sections = index['sections']
+    shared_base_slide_id = index['shared_base_slide_id']
+    order = list(index['slide_order'])
+
+    section_of = {sid: s['name'] for s in sections for sid in s['slide_ids']}
+    outline = {
+        sid: {
+            "section": section_of.get(sid),
+            "kind": "template",
+            "text": index['slide_texts'].get(str(sid), ''),
+            "notes": None,
+            "morph": False,
+        }
+        for sid in order
+    }
+
+    def remove(sid):
+        if sid not in order:
+            raise ValueError(f"Slide with id={sid} not found in presentation")
+        order.remove(sid)
+
+    for song_num, song in enumerate(songs):
+        section_name = song.get('section_name', '')
+        if not section_name:
+            raise ValueError(f"Song '{song.get('title', '?')}' has no section_name")
+
+        section = find_section_by_name(sections, section_name)
+        if section is None:
+            available = [s['name'] for s in sections]
+            raise ValueError(
+                f"Section '{section_name}' not found in template. "
+                f"Available sections: {available}"
+            )
+
+        slide_ids = section['slide_ids']
+        if len(slide_ids) < 2:
+            raise ValueError(
+                f"Section '{section_name}' needs at least 2 slides (title + base), "
+                f"but has {len(slide_ids)}"
+            )
+        title_slide_id, section_base_slide_id = slide_ids[0], slide_ids[1]
+
+        outline[title_slide_id].update(kind="title", text=song['title'])
+        for sid in slide_ids[2:]:
+            remove(sid)
+
+        generated = []
+        for page, planned in enumerate(plan_song_slides(song, section_name)):
+            key = f'{song_num}:{page}'
+            outline[key] = {
+                "section": section_name,
+                "kind": planned['kind'],
+                "text": planned['text'],
+                "notes": planned['notes'] if notes_mode != 'none' else None,
+                "morph": planned['morph'],
+            }
+            generated.append(key)
+        insert_at = order.index(section_base_slide_id) + 1
+        order[insert_at:insert_at] = generated
+
+        if section_base_slide_id != shared_base_slide_id:
+            remove(section_base_slide_id)
+
+    remove(shared_base_slide_id)
+
+    return {
+        "slide_count": len(order),
+        "slides": [
+            {"slide_number": num, **outline[key]}
+            for num, key in enumerate(order, 1)
+        ],
+    }
+
+
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
@@ -794,12 +1929,28 @@ class handler(BaseHTTPRequestHandler):
                 return
 
             content_length = int(self.headers.get('Content-Length', 0))
+            if content_length > MAX_REQUEST_BYTES:
+                self.send_json(413, {
+                    "success": False,
+                    "error": f"Request body too large ({content_length} bytes, limit {MAX_REQUEST_BYTES})"
+                })
+                return
             body = json.loads(self.rfile.read(content_length))
 
             action = body.get('action')
 
             if action == 'export_lyrics':
                 self._handle_export_lyrics(body)
+            elif action == 'compile_template':
+                self._handle_compile_template(body)
+            elif action == 'preview_export':
+                self._handle_preview_export(body)
+            elif action == 'inspect_batch':
+                self._handle_inspect_batch(body)
+            elif action == 'lint_template':
+                self._handle_lint_template(body)
+            elif action == 'warm':
+                self._handle_warm(body)
             else:
                 self.send_json(400, {"success": False, "error": f"Unknown action: {action}"})
 
@@ -813,6 +1964,11 @@ class handler(BaseHTTPRequestHandler):
                 "success": False,
                 "error": str(e)
             })
+        except MemoryBudgetExceeded as e:
+            self.send_json(413, {
+                "success": False,
+                "error": str(e)
+            })
         except Exception as e:
             traceback.print_exc()
             self.send_json(500, {
@@ -832,6 +1988,7 @@ class handler(BaseHTTPRequestHandler):
         # Note: output_folder_id is kept for backward compatibility but unused since new files go to Vercel Blob
         output_folder_id = body.get('output_folder_id', os.environ.get('GOOGLE_DRIVE_TEMPLATE_FOLDER_ID'))
         songs = body.get('songs', [])
+        notes_mode = body.get('notes_mode', 'prototype')
 
         if not overwrite and not output_file_name:
             self.send_json(400, {"success": False, "error": "output_file_name is required when not overwriting"})
@@ -847,16 +2004,40 @@ class handler(BaseHTTPRequestHandler):
         template_path = os.path.join(tmp_dir, 'template.pptx')
         output_path = os.path.join(tmp_dir, 'output.pptx')
 
-        try:
-            download_file_by_id(service, file_id, template_path)
+        memory = MemoryTracker()
 
-            prs = Presentation(template_path)
-            result_stats = process_all_songs(prs, songs)
-            prs.save(output_path)
-            cleanup_orphaned_parts(output_path)
+        try:
+            with memory.stage('download'):
+                checksum, compiled = get_compiled_template(service, file_id, template_path)
+
+            estimate = estimate_export_memory(template_path, compiled, songs)
+            low_memory = check_memory_budget(estimate)
+
+            with memory.stage('load'):
+                prs = Presentation(template_path)
+            with memory.stage('generate'):
+                # Low-memory mode still splices cached songs but stores no new ones
+                result_stats = process_all_songs(prs, songs, notes_mode,
+                                                 compiled['shared_base_slide_id'],
+                                                 checksum, fill_fragment_cache=not low_memory)
+            with memory.stage('save'):
+                prs.save(output_path)
+                if low_memory:
+                    # Drop the in-memory deck before post-processing and upload
+                    del prs
+                    gc.collect()
+            with memory.stage('cleanup'):
+                cleanup_orphaned_parts(output_path)
+
+            memory_info = {
+                "budget_mb": MEMORY_BUDGET_MB,
+                "estimate_mb": _mb(estimate),
+                "low_memory": low_memory,
+            }
 
             if overwrite:
-                result = overwrite_drive_file(service, file_id, output_path)
+                with memory.stage('upload'):
+                    result = overwrite_drive_file(service, file_id, output_path)
                 self.send_json(200, {
                     "success": True,
                     "data": {
@@ -865,12 +2046,15 @@ class handler(BaseHTTPRequestHandler):
                         "web_view_link": result.get('webViewLink', ''),
                         "songs_processed": result_stats['songs_processed'],
                         "slides_generated": result_stats['slides_generated'],
+                        "songs_from_cache": result_stats['songs_from_cache'],
+                        "memory": memory.report(**memory_info),
                     }
                 })
             else:
                 # Upload to Vercel Blob and return JSON with download URL
                 try:
-                    download_url = upload_to_blob(output_path, output_file_name)
+                    with memory.stage('upload'):
+                        download_url = upload_to_blob(output_path, output_file_name)
                     self.send_json(200, {
                         "success": True,
                         "data": {
@@ -880,6 +2064,8 @@ class handler(BaseHTTPRequestHandler):
                             "download_url": download_url,
                             "songs_processed": result_stats['songs_processed'],
                             "slides_generated": result_stats['slides_generated'],
+                            "songs_from_cache": result_stats['songs_from_cache'],
+                            "memory": memory.report(**memory_info),
                         }
                     })
                 except ValueError as e:
@@ -894,19 +2080,107 @@ class handler(BaseHTTPRequestHandler):
                         "success": False,
                         "error": f"Failed to upload to blob storage: {str(e)}"
                     })
+        finally:
+            memory.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _handle_compile_template(self, body):
+        """Handle the compile_template action."""
+        file_id = body.get('file_id')
+        if not file_id:
+            self.send_json(400, {"success": False, "error": "file_id is required"})
+            return
+
+        service = get_drive_service()
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            checksum, compiled = get_compiled_template(
+                service, file_id, os.path.join(tmp_dir, 'compiled.pptx'),
+                force=body.get('force', False),
+            )
+            self.send_json(200, {"success": True, "data": {**compiled, "checksum": checksum}})
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _handle_preview_export(self, body):
+        """Handle the preview_export action."""
+        file_id = body.get('file_id')
+        if not file_id:
+            self.send_json(400, {"success": False, "error": "file_id is required"})
+            return
+
+        songs = body.get('songs', [])
+        if not songs:
+            self.send_json(400, {"success": False, "error": "No songs provided"})
+            return
+
+        index = get_template_index(get_drive_service(), file_id)
+        outline = preview_export(index, songs, body.get('notes_mode', 'prototype'))
+        self.send_json(200, {"success": True, "data": outline})
+
+    def _handle_inspect_batch(self, body):
+        """Handle the inspect_batch action."""
+        file_ids = body.get('file_ids', [])
+        if not file_ids or not isinstance(file_ids, list):
+            self.send_json(400, {"success": False, "error": "file_ids is required"})
+            return
+        if len(file_ids) > INSPECT_BATCH_MAX_FILES:
+            self.send_json(400, {
+                "success": False,
+                "error": f"Too many file_ids ({len(file_ids)}, limit {INSPECT_BATCH_MAX_FILES})"
+            })
+            return
+
+        results = inspect_templates(file_ids)
+        self.send_json(200, {"success": True, "data": {"results": results}})
+
+    def _handle_warm(self, body):
+        """Handle the warm action."""
+        file_ids = body.get('file_ids') or WARM_TEMPLATE_IDS
+        if not isinstance(file_ids, list) or not all(isinstance(i, str) and i for i in file_ids):
+            self.send_json(400, {"success": False, "error": "file_ids must be a list of file ids"})
+            return
+        if len(file_ids) > WARM_MAX_FILES:
+            self.send_json(400, {
+                "success": False,
+                "error": f"Too many file_ids ({len(file_ids)}, limit {WARM_MAX_FILES})"
+            })
+            return
+
+        self.send_json(200, {"success": True, "data": warm_caches(file_ids)})
+
+    def _handle_lint_template(self, body):
+        """Handle the lint_template action."""
+        file_id = body.get('file_id')
+        if not file_id:
+            self.send_json(400, {"success": False, "error": "file_id is required"})
+            return
+
+        service = get_drive_service()
+        tmp_dir = tempfile.mkdtemp()
+        template_path = os.path.join(tmp_dir, 'template.pptx')
+        try:
+            download_template(service, file_id, template_path)
+            self.send_json(200, {"success": True, "data": lint_template(template_path)})
         finally:
             shutil.rmtree(tmp_dir, ignore_errors=True)
 
     def do_GET(self):
-        """Health check / template inspection endpoint."""
+        """Health check / template inspection / cron warm-up endpoint."""
         try:
-            if not verify_auth(self):
+            # Vercel Cron can only send GET with a path, so the action may
+            # also come from the query string (e.g. /api/pptx?action=warm)
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            action = self.headers.get('X-Action') or query.get('action', ['health'])[0]
+
+            authorized = verify_auth(self) or (action == 'warm' and verify_cron_auth(self))
+            if not authorized:
                 self.send_json(401, {"success": False, "error": "Unauthorized"})
                 return
 
-            action = self.headers.get('X-Action', 'health')
-
-            if action == 'inspect':
+            if action == 'warm':
+                self.send_json(200, {"success": True, "data": warm_caches(WARM_TEMPLATE_IDS)})
+            elif action == 'inspect':
                 file_id = self.headers.get('X-File-Id', '')
 
                 if not file_id:
@@ -918,7 +2192,7 @@ class handler(BaseHTTPRequestHandler):
                 template_path = os.path.join(tmp_dir, 'template.pptx')
 
                 try:
-                    download_file_by_id(service, file_id, template_path)
+                    download_template(service, file_id, template_path)
                     structure = inspect_template(template_path)
                     self.send_json(200, {"success": True, "data": structure})
                 finally:
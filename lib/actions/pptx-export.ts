@@ -3,8 +3,12 @@
 import type {
   ActionResult,
   PptxDriveFile,
+  PptxExportPreview,
   PptxExportResult,
   PptxExportSongData,
+  PptxNotesMode,
+  PptxTemplateInspectResult,
+  PptxTemplateLintReport,
   PptxTemplateStructure,
 } from '@/lib/types';
 
@@ -140,6 +144,7 @@ export async function exportContiToPptx(options: {
   outputFileName?: string;
   songs: PptxExportSongData[];
   outputFolderId?: string;
+  notesMode?: PptxNotesMode;
 }): Promise<ActionResult<PptxExportResult>> {
   try {
     const url = getPptxApiUrl();
@@ -154,6 +159,7 @@ export async function exportContiToPptx(options: {
         overwrite: options.overwrite,
         output_file_name: options.outputFileName,
         output_folder_id: options.outputFolderId,
+        notes_mode: options.notesMode,
         songs: options.songs,
       }),
     });
@@ -190,6 +196,43 @@ export async function exportContiToPptx(options: {
   }
 }
 
+export async function previewPptxExport(options: {
+  fileId: string;
+  songs: PptxExportSongData[];
+  notesMode?: PptxNotesMode;
+}): Promise<ActionResult<PptxExportPreview>> {
+  try {
+    const response = await fetch(getPptxApiUrl(), {
+      method: 'POST',
+      headers: getPptxHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify({
+        action: 'preview_export',
+        file_id: options.fileId,
+        notes_mode: options.notesMode,
+        songs: options.songs,
+      }),
+    });
+
+    const text = await response.text();
+    let result: { success: boolean; error?: string; data?: PptxExportPreview };
+    try {
+      result = JSON.parse(text);
+    } catch {
+      console.error('[previewPptxExport] Non-JSON response:', response.status, text.slice(0, 500));
+      return { success: false, error: `PPT 서버 오류 (${response.status}): 응답을 처리할 수 없습니다` };
+    }
+
+    if (!result.success) {
+      return { success: false, error: result.error || 'PPT 미리보기에 실패했습니다' };
+    }
+
+    return { success: true, data: result.data };
+  } catch (error) {
+    console.error('[previewPptxExport]', error);
+    return { success: false, error: 'PPT 미리보기 중 오류가 발생했습니다' };
+  }
+}
+
 export async function inspectPptxTemplate(
   fileId: string
 ): Promise<ActionResult<PptxTemplateStructure>> {
@@ -221,3 +264,63 @@ export async function inspectPptxTemplate(
     return { success: false, error: '템플릿 검사 중 오류가 발생했습니다' };
   }
 }
+
+export async function inspectPptxTemplates(
+  fileIds: string[]
+): Promise<ActionResult<{ results: PptxTemplateInspectResult[] }>> {
+  try {
+    const response = await fetch(getPptxApiUrl(), {
+      method: 'POST',
+      headers: getPptxHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify({ action: 'inspect_batch', file_ids: fileIds }),
+    });
+
+    const text = await response.text();
+    let result: { success: boolean; error?: string; data?: { results: PptxTemplateInspectResult[] } };
+    try {
+      result = JSON.parse(text);
+    } catch {
+      console.error('[inspectPptxTemplates] Non-JSON response:', response.status, text.slice(0, 500));
+      return { success: false, error: `PPT 서버 오류 (${response.status}): 응답을 처리할 수 없습니다` };
+    }
+
+    if (!result.success) {
+      return { success: false, error: result.error };
+    }
+
+    return { success: true, data: result.data };
+  } catch (error) {
+    console.error('[inspectPptxTemplates]', error);
+    return { success: false, error: '템플릿 검사 중 오류가 발생했습니다' };
+  }
+}
+
+export async function lintPptxTemplate(
+  fileId: string
+): Promise<ActionResult<PptxTemplateLintReport>> {
+  try {
+    const response = await fetch(getPptxApiUrl(), {
+      method: 'POST',
+      headers: getPptxHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify({ action: 'lint_template', file_id: fileId }),
+    });
+
+    const text = await response.text();
+    let result: { success: boolean; error?: string; data?: PptxTemplateLintReport };
+    try {
+      result = JSON.parse(text);
+    } catch {
+      console.error('[lintPptxTemplate] Non-JSON response:', response.status, text.slice(0, 500));
+      return { success: false, error: `PPT 서버 오류 (${response.status}): 응답을 처리할 수 없습니다` };
+    }
+
+    if (!result.success) {
+      return { success: false, error: result.error };
+    }
+
+    return { success: true, data: result.data };
+  } catch (error) {
+    console.error('[lintPptxTemplate]', error);
+    return { success: false, error: '템플릿 검사 중 오류가 발생했습니다' };
+  }
+}
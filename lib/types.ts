@@ -159,12 +159,15 @@ export interface PptxExportSongData {
   section_lyrics_map: Record<string, number[]>;
 }
 
+export type PptxNotesMode = 'full' | 'prototype' | 'none';
+
 export interface PptxExportRequest {
   action: 'export_lyrics';
   file_id: string;
   overwrite: boolean;
   output_file_name?: string;
   output_folder_id?: string;
+  notes_mode?: PptxNotesMode;
   songs: PptxExportSongData[];
 }
 
@@ -175,6 +178,37 @@ export interface PptxExportResult {
   download_url?: string;
   songs_processed: number;
   slides_generated: number;
+  songs_from_cache?: number;
+  memory?: PptxExportMemoryReport;
+}
+
+export interface PptxExportMemoryReport {
+  budget_mb: number;
+  estimate_mb: number;
+  low_memory: boolean;
+  process_peak_rss_mb: number;  // process-lifetime high-water mark
+  stages: {
+    stage: string;
+    ms: number;
+    rss_mb: number;
+    rss_delta_mb: number;
+    peak_rss_mb: number;  // sampled while the stage ran
+    traced_peak_mb?: number;
+  }[];
+}
+
+export interface PptxPreviewSlide {
+  slide_number: number;
+  section: string | null;
+  kind: 'title' | 'lyrics' | 'blank' | 'template';
+  text: string;
+  notes: string | null;
+  morph: boolean;
+}
+
+export interface PptxExportPreview {
+  slide_count: number;
+  slides: PptxPreviewSlide[];
 }
 
 export interface PptxTemplateSectionInfo {
@@ -206,3 +240,28 @@ export interface PptxTemplateStructure {
   slides: PptxTemplateSlide[];
   sections: PptxTemplateSectionInfo[] | null;
 }
+
+export interface PptxTemplateLintHazard {
+  kind: 'large_image' | 'unused_example_slides' | 'embedded_font' | 'complex_base_slide' | 'unused_layouts';
+  severity: 'high' | 'medium' | 'low';
+  message: string;
+  [detail: string]: unknown;
+}
+
+export interface PptxTemplateLintReport {
+  file_size: number;
+  slide_count: number;
+  section_count: number;
+  media_bytes: number;
+  base_slide: {
+    slide_id: number;
+    shape_count: number;
+    xml_bytes: number;
+    clone_ms_per_slide: number;
+  };
+  hazards: PptxTemplateLintHazard[];
+}
+
+export type PptxTemplateInspectResult =
+  | { file_id: string; success: true; data: PptxTemplateStructure }
+  | { file_id: string; success: false; error: string };
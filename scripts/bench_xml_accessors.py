@@ -0,0 +1,103 @@
+"""Micro-benchmark for the XML accessors in api/pptx.py.
+
+Builds a synthetic presentation with many slides (and one slide with many
+shapes carrying r:* attributes) and times the precompiled accessors against
+the per-call find/findall/iter scans they replaced: slide-id map, sldId
+lookup and rId remapping.
+
+Usage:
+    python scripts/bench_xml_accessors.py [--slides 400] [--shapes 2000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+from copy import deepcopy
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from serve_pptx import load_api  # noqa: E402
+
+
+def build_presentation(api, slide_count, shape_count):
+    from pptx import Presentation
+    from pptx.util import Emu
+
+    prs = Presentation()
+    layout = prs.slide_layouts[6]
+    for _ in range(slide_count):
+        prs.slides.add_slide(layout)
+
+    # Bulk up one slide with shapes that carry r:* attributes
+    big = prs.slides[0]
+    for i in range(shape_count):
+        box = big.shapes.add_textbox(Emu(i), Emu(i), Emu(100), Emu(100))
+        box._element.set(api.R_ID, f'rId{i % 7 + 1}')
+
+    return prs, big._element
+
+
+# Previous implementations, kept here only for comparison
+
+def old_slide_id_map(api, prs):
+    sld_id_lst = prs._element.find(api._pn('sldIdLst'))
+    entries = [(int(el.get('id')), el.get(api._rn('id')), el)
+               for el in sld_id_lst.findall(api._pn('sldId'))]
+    return {sid: {'index': idx, 'rId': rid, 'element': el,
+                  'slide': prs.slides[idx] if idx < len(prs.slides) else None}
+            for idx, (sid, rid, el) in enumerate(entries)}
+
+
+def old_find_sld_id(api, prs, slide_id):
+    for el in prs._element.find(api._pn('sldIdLst')).findall(api._pn('sldId')):
+        if int(el.get('id')) == slide_id:
+            return el
+    return None
+
+
+def old_remap(api, element, rId_map):
+    for el in element.iter():
+        for attr_name in list(el.attrib.keys()):
+            if api.R_NS in attr_name:
+                val = el.get(attr_name)
+                if val in rId_map:
+                    el.set(attr_name, rId_map[val])
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slides', type=int, default=400)
+    parser.add_argument('--shapes', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    api = load_api()
+    prs, big_slide = build_presentation(api, args.slides, args.shapes)
+    last_id = int(api.xp_last_sld_id(prs._element)[0].get('id'))
+    rId_map = {f'rId{n}': f'rId{n + 100}' for n in range(1, 8)}
+
+    cases = [
+        ('slide id map', lambda: old_slide_id_map(api, prs), lambda: api.get_slide_id_map(prs)),
+        ('find last sldId', lambda: old_find_sld_id(api, prs, last_id),
+         lambda: api.find_sld_id(prs._element, last_id)),
+        ('rId remap', lambda: old_remap(api, deepcopy(big_slide), rId_map),
+         lambda: api._remap_slide_rids(deepcopy(big_slide), rId_map)),
+    ]
+    print(f'{args.slides} slides, {args.shapes} shapes on the large slide, '
+          f'{args.repeat} repeats')
+    print(f'{"case":<18} {"old ms":>10} {"new ms":>10} {"speedup":>9}')
+    for name, old, new in cases:
+        new_ms = timeit(new, args.repeat)
+        old_ms = timeit(old, args.repeat)
+        print(f'{name:<18} {old_ms:>10.3f} {new_ms:>10.3f} {old_ms / new_ms:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""Load-test harness for the PPTX export function (api/pptx.py).
+
+Starts local stand-ins for the Google Drive files/media endpoints and the
+Vercel Blob PUT endpoint (with configurable latency and bandwidth), serves
+api/pptx.py's handler through the pooled server from serve_pptx.py, and
+drives it with concurrent export_lyrics and inspect requests. Reports
+throughput, p50/p95/p99 latency and error rates per request kind, export
+latency split by fragment-cache hit/miss, and peak memory.
+
+--unique-songs sets the fraction of songs in each export that get
+request-specific lyrics and therefore miss the fragment cache; at 0 every
+export after the first is served from it. --no-fragment-cache turns the
+cache off to measure the uncached cost.
+
+Usage:
+    python scripts/loadtest_pptx.py path/to/template.pptx \\
+        [--requests 100] [--concurrency 8] [--workers 8] [--songs 4] \\
+        [--unique-songs 0.5] [--no-fragment-cache] \\
+        [--inspect-ratio 0.2] [--latency-ms 50] [--bandwidth-mbps 50]
+
+No real Google or Vercel credentials are used or needed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from serve_pptx import PooledHTTPServer, load_api  # noqa: E402
+
+AUTH_SECRET = 'loadtest-secret'
+CHUNK_SIZE = 64 * 1024
+
+
+def make_fake_services_handler(template_bytes, latency_s, bytes_per_s, stats):
+    """Build a request handler emulating the Drive and Blob endpoints used by api/pptx.py."""
+    checksum = hashlib.md5(template_bytes).hexdigest()
+
+    class FakeServicesHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _throttled_write(self, data):
+            for i in range(0, len(data), CHUNK_SIZE):
+                chunk = data[i:i + CHUNK_SIZE]
+                self.wfile.write(chunk)
+                if bytes_per_s:
+                    time.sleep(len(chunk) / bytes_per_s)
+
+        def _send(self, status, body, content_type='application/json'):
+            time.sleep(latency_s)
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self._throttled_write(body)
+
+        def do_GET(self):
+            # Drive: /drive/v3/files/<id>?fields=... or ?alt=media
+            path, _, query = self.path.partition('?')
+            params = urllib.parse.parse_qs(query)
+            if not path.startswith('/drive/v3/files/'):
+                self._send(404, b'{"error": "not found"}')
+                return
+            if params.get('alt') == ['media']:
+                stats.incr('drive_media')
+                self._send(200, template_bytes, 'application/octet-stream')
+            else:
+                stats.incr('drive_metadata')
+                self._send(200, json.dumps({'md5Checksum': checksum}).encode())
+
+        def do_PUT(self):
+            # Blob: /pptx-exports/<name>
+            length = int(self.headers.get('Content-Length', 0))
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                if bytes_per_s:
+                    time.sleep(len(chunk) / bytes_per_s)
+            stats.incr('blob_put')
+            host = self.headers.get('Host', 'localhost')
+            self._send(200, json.dumps({'url': f'http://{host}{self.path}'}).encode())
+
+    return FakeServicesHandler
+
+
+class Stats:
+    """Thread-safe counters, latency samples and server memory figures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.latencies = {}
+        self.errors = {}
+        self.outcomes = {}
+        self.server_peaks_mb = []
+
+    def incr(self, key):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def record(self, kind, seconds, ok, error=None, outcome=None, server_peak_mb=None):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+            if not ok:
+                self.errors.setdefault(kind, []).append(error)
+            if outcome:
+                self.outcomes.setdefault(outcome, []).append(seconds)
+            if server_peak_mb is not None:
+                self.server_peaks_mb.append(server_peak_mb)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def build_songs(api, template_path, count):
+    """Synthesize a setlist that uses the template's first `count` usable sections."""
+    from pptx import Presentation
+
+    sections = [s for s in api.parse_sections(Presentation(template_path))
+                if len(s['slide_ids']) >= 2]
+    if not sections:
+        raise SystemExit('Template has no section with a title and base slide')
+    songs = []
+    for i, section in enumerate(sections[:count]):
+        songs.append({
+            'title': f'Load test song {i + 1}',
+            'section_name': section['name'],
+            'section_order': ['Intro', 'Verse', 'Chorus', 'Verse', 'Chorus', 'Bridge', 'Chorus'],
+            'lyrics': [f'Verse line {n}\nsecond line' for n in range(4)],
+            'section_lyrics_map': {'1': [0, 1], '2': [2], '3': [0, 1], '4': [2], '5': [3], '6': [2]},
+        })
+    return songs
+
+
+def vary_songs(songs, unique_ratio):
+    """Copy a setlist, giving each song request-specific lyrics with probability unique_ratio."""
+    varied = []
+    for song in songs:
+        if random.random() < unique_ratio:
+            tag = f'{random.getrandbits(32):08x}'
+            song = {**song, 'lyrics': [f'{line} {tag}' for line in song['lyrics']]}
+        varied.append(song)
+    return varied
+
+
+def cache_outcome(data, song_count):
+    """Classify an export response by how many songs came from the fragment cache."""
+    from_cache = data.get('songs_from_cache', 0)
+    if from_cache == song_count:
+        return 'hit'
+    return 'miss' if from_cache == 0 else 'partial'
+
+
+def server_peak_mb(data):
+    """Highest per-stage RSS the export reported, or None."""
+    stages = (data.get('memory') or {}).get('stages') or []
+    return max((s['peak_rss_mb'] for s in stages), default=None)
+
+
+def call(url, kind, songs):
+    headers = {'Authorization': f'Bearer {AUTH_SECRET}'}
+    if kind == 'export':
+        body = json.dumps({
+            'action': 'export_lyrics',
+            'file_id': 'loadtest-template',
+            'output_file_name': f'loadtest-{random.getrandbits(32):08x}.pptx',
+            'songs': songs,
+        }).encode()
+        headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(url, data=body, method='POST', headers=headers)
+    else:
+        headers.update({'X-Action': 'inspect', 'X-File-Id': 'loadtest-template'})
+        req = urllib.request.Request(url, method='GET', headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            data = json.loads(response.read())
+        return data.get('success', False), data.get('error'), data.get('data') or {}
+    except urllib.error.HTTPError as e:
+        return False, f'HTTP {e.code}: {e.read()[:200]!r}', {}
+    except Exception as e:
+        return False, str(e), {}
+
+
+def start_server(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('template', help='Path to a sectioned .pptx template')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=8, help='Export server worker threads')
+    parser.add_argument('--songs', type=int, default=4, help='Songs per export')
+    parser.add_argument('--unique-songs', type=float, default=0.5,
+                        help='Fraction of songs per export with request-specific lyrics (cache misses)')
+    parser.add_argument('--no-fragment-cache', action='store_true',
+                        help='Disable the rendered-song fragment cache')
+    parser.add_argument('--inspect-ratio', type=float, default=0.2)
+    parser.add_argument('--latency-ms', type=float, default=50, help='Fake service latency per call')
+    parser.add_argument('--bandwidth-mbps', type=float, default=50, help='Fake service bandwidth (0 = unlimited)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stats = Stats()
+    with open(args.template, 'rb') as f:
+        template_bytes = f.read()
+
+    fake_handler = make_fake_services_handler(
+        template_bytes, args.latency_ms / 1000, args.bandwidth_mbps * 125_000, stats
+    )
+    fake_server = ThreadingHTTPServer(('127.0.0.1', 0), fake_handler)
+    fake_server.daemon_threads = True
+    start_server(fake_server)
+    fake_url = f'http://127.0.0.1:{fake_server.server_port}'
+
+    cache_dir = tempfile.mkdtemp(prefix='pptx-loadtest-cache-')
+    try:
+        run(args, stats, fake_server, fake_url, cache_dir)
+    finally:
+        fake_server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def run(args, stats, fake_server, fake_url, cache_dir):
+    os.environ.update({
+        'AUTH_SECRET': AUTH_SECRET,
+        'BLOB_READ_WRITE_TOKEN': 'loadtest-token',
+        'BLOB_API_URL': fake_url,
+        'GOOGLE_DRIVE_API_ENDPOINT': fake_url + '/drive/v3/',
+        'PPTX_TEMPLATE_CACHE_DIR': cache_dir,
+    })
+    api = load_api()
+    # The fake Drive does not check tokens; skip the service-account exchange
+    from google.auth.credentials import AnonymousCredentials
+    api._drive_credentials = AnonymousCredentials()
+    if args.no_fragment_cache:
+        api.fragment_cache.max_bytes = 0
+
+    export_server = PooledHTTPServer(('127.0.0.1', 0), api.handler, args.workers)
+    export_server.RequestHandlerClass.log_message = lambda *a, **k: None
+    start_server(export_server)
+    export_url = f'http://127.0.0.1:{export_server.server_port}/api/pptx'
+
+    songs = build_songs(api, args.template, args.songs)
+    # Payloads are drawn up front so a seed reproduces the same mix
+    requests = []
+    for _ in range(args.requests):
+        if random.random() < args.inspect_ratio:
+            requests.append(('inspect', None))
+        else:
+            requests.append(('export', vary_songs(songs, args.unique_songs)))
+
+    def run_one(request):
+        kind, payload = request
+        start = time.perf_counter()
+        ok, error, data = call(export_url, kind, payload)
+        elapsed = time.perf_counter() - start
+        if kind == 'export' and ok:
+            stats.record(kind, elapsed, ok, error, cache_outcome(data, len(payload)), server_peak_mb(data))
+        else:
+            stats.record(kind, elapsed, ok, error)
+
+    kinds = [kind for kind, _ in requests]
+    print(f'Running {args.requests} requests ({kinds.count("export")} export, '
+          f'{kinds.count("inspect")} inspect), concurrency={args.concurrency}, '
+          f'workers={args.workers}, songs/export={len(songs)}, '
+          f'unique songs={args.unique_songs:.0%}, '
+          f'fragment cache={"off" if args.no_fragment_cache else "on"}', flush=True)
+    wall_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(run_one, requests))
+    finally:
+        export_server.shutdown()
+        export_server.server_close()
+    wall = time.perf_counter() - wall_start
+
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f'\nWall time: {wall:.2f}s  Throughput: {total / wall:.2f} req/s')
+    print(f'{"kind":<8} {"count":>6} {"errors":>7} {"error %":>8} '
+          f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for kind, samples in sorted(stats.latencies.items()):
+        errors = len(stats.errors.get(kind, []))
+        print(f'{kind:<8} {len(samples):>6} {errors:>7} {errors / len(samples):>8.1%} '
+              f'{percentile(samples, 50) * 1000:>9.1f} {percentile(samples, 95) * 1000:>9.1f} '
+              f'{percentile(samples, 99) * 1000:>9.1f} {max(samples) * 1000:>9.1f}')
+    for kind, errors in sorted(stats.errors.items()):
+        print(f'  first {kind} error: {errors[0]}')
+
+    if stats.outcomes:
+        print('\nSuccessful exports by fragment cache outcome '
+              '(hit: every song cached, partial: some, miss: none)')
+        print(f'{"outcome":<8} {"count":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+        for outcome in ('hit', 'partial', 'miss'):
+            samples = stats.outcomes.get(outcome)
+            if not samples:
+                continue
+            print(f'{outcome:<8} {len(samples):>6} '
+                  f'{percentile(samples, 50) * 1000:>9.1f} {percentile(samples, 95) * 1000:>9.1f} '
+                  f'{percentile(samples, 99) * 1000:>9.1f} {max(samples) * 1000:>9.1f}')
+
+    if stats.server_peaks_mb:
+        # Sampled by the export's memory stages; RSS is process-wide and the
+        # server runs inside this process, so it includes the harness too
+        print(f'\nServer-reported peak RSS per export (data.memory stages): '
+              f'p95 {percentile(stats.server_peaks_mb, 95):.1f} MB, '
+              f'max {max(stats.server_peaks_mb):.1f} MB')
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+    print(f'Process peak RSS (harness + server + fakes): {peak_mb:.1f} MB')
+    print(f'Fake service calls: {stats.counters}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Self-hosted server for the PPTX export function (api/pptx.py).
+
+Serves the same do_POST/do_GET contract as the Vercel deployment, but with a
+bounded pool of worker threads so concurrent exports don't queue behind each
+other. Workers share one process, so the Drive credentials and the on-disk
+template cache are warm for all of them.
+
+Usage:
+    python scripts/serve_pptx.py [--host 0.0.0.0] [--port 8080] [--workers 8] \\
+        [--max-queue 64] [--timeout 30]
+
+Environment: the same variables as the Vercel function (AUTH_SECRET,
+GOOGLE_SERVICE_ACCOUNT_JSON, BLOB_READ_WRITE_TOKEN, PPTX_*).
+"""
+import argparse
+import importlib.util
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import HTTPServer
+
+API_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api', 'pptx.py')
+
+
+def load_api():
+    """Import api/pptx.py under another module name.
+
+    The file is called pptx.py, so importing it by its own name (or running it
+    directly) would shadow the python-pptx package it depends on.
+    """
+    spec = importlib.util.spec_from_file_location('pptx_api', API_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['pptx_api'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a fixed-size thread pool.
+
+    Unlike ThreadingHTTPServer the number of concurrent requests is bounded;
+    up to max_queue extra connections wait for a worker and any beyond that
+    get an immediate 503. Each connection's socket has a read timeout so an
+    idle or slow client cannot hold a worker. server_close() waits for
+    in-flight requests to finish.
+    """
+
+    def __init__(self, server_address, handler_class, workers, max_queue=64, timeout=30):
+        # Subclass so the timeout doesn't leak onto the shared handler class
+        handler_class = type(handler_class.__name__, (handler_class,), {'timeout': timeout})
+        super().__init__(server_address, handler_class)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pptx-worker')
+        # Running + queued connections
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def _reject(self, request):
+        body = b'{"success": false, "error": "Server busy"}'
+        head = (f'HTTP/1.1 {HTTPStatus.SERVICE_UNAVAILABLE.value} Service Unavailable\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                'Retry-After: 1\r\nConnection: close\r\n\r\n')
+        try:
+            request.sendall(head.encode() + body)
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def serve(host='0.0.0.0', port=8080, workers=8, max_queue=64, timeout=30, api=None):
+    """Run the export handler until SIGINT/SIGTERM, then drain and exit."""
+    api = api or load_api()
+    server = PooledHTTPServer((host, port), api.handler, workers, max_queue, timeout)
+
+    def request_shutdown(signum, frame):
+        print(f'Received signal {signum}, finishing in-flight requests...', flush=True)
+        # shutdown() blocks until serve_forever() returns, so call it off-thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    print(f'Serving api/pptx.py on http://{host}:{server.server_port} '
+          f'with {workers} workers', flush=True)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    print('Server stopped', flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=os.environ.get('PPTX_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PPTX_PORT', 8080)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('PPTX_WORKERS', 8)))
+    parser.add_argument('--max-queue', type=int, default=int(os.environ.get('PPTX_MAX_QUEUE', 64)),
+                        help='Connections allowed to wait for a worker before returning 503')
+    parser.add_argument('--timeout', type=float, default=float(os.environ.get('PPTX_SOCKET_TIMEOUT', 30)),
+                        help='Per-connection socket timeout in seconds')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.max_queue, args.timeout)
+
+
+if __name__ == '__main__':
+    main()